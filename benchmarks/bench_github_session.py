@@ -0,0 +1,87 @@
+"""Compares the request rate of a client reopened per page with a persistent GitHubSession.
+
+A mock of the GitHub GraphQL and REST endpoints is served locally, so the benchmark
+measures the connection handling only. Run it from the repository root:
+
+    python benchmarks/bench_github_session.py [number of requests]
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import requests
+from aiohttp import web
+from gql import GraphQLRequest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from github_session import GitHubSession, create_client
+from token_pool import TokenPool
+
+QUERY = """
+    query getReposCount ($query: String!) {
+        search(type:REPOSITORY, query:$query) {
+            repositoryCount
+        }
+    }"""
+
+
+async def graphql_handler(request: web.Request) -> web.Response:
+    await request.read()
+    return web.json_response({"data": {"search": {"repositoryCount": 42}}})
+
+
+async def commits_handler(request: web.Request) -> web.Response:
+    return web.json_response([{"sha": "0" * 40}])
+
+
+def start_mock_server() -> str:
+    """Starts the mock API in a background thread and returns its base URL."""
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_post("/graphql", graphql_handler)
+    app.router.add_get("/repos/{owner}/{name}/commits", commits_handler)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+async def before(api_url: str, n: int) -> None:
+    """One GraphQL client opened per query and one requests.get per REST call."""
+    client = create_client("token", api_url=api_url)
+    request = GraphQLRequest(QUERY, variable_values={"query": "digital twin"})
+    for _ in range(n):
+        async with client as session:
+            await session.execute(request)
+        requests.get(f"{api_url}/repos/owner/name/commits", params={"per_page": 1})
+
+
+async def after(api_url: str, n: int) -> None:
+    """Every call goes through the same GitHubSession."""
+    request = GraphQLRequest(QUERY, variable_values={"query": "digital twin"})
+    # The mock server has no quota, the requests are not paced
+    tokens = TokenPool(["token"], limits={"core": (10**9, 1)})
+    async with GitHubSession(tokens, api_url=api_url) as session:
+        for _ in range(n):
+            await session.execute(request)
+            await session.get("/repos/owner/name/commits", params={"per_page": 1})
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    api_url = start_mock_server()
+
+    for name, benchmark in (("before", before), ("after", after)):
+        start = time.perf_counter()
+        asyncio.run(benchmark(api_url, n))
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {2 * n} requests in {elapsed:.2f}s ({2 * n / elapsed:.0f} requests/s)")
+
+
+if __name__ == "__main__":
+    main()
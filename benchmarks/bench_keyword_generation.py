@@ -0,0 +1,66 @@
+"""Compares sequential keyword generation with concurrent generation against a stub Ollama server.
+
+The stub answers /api/chat after a fixed delay, like a model generating a response, and
+handles several requests at the same time, like a server with OLLAMA_NUM_PARALLEL set.
+Run it from the repository root:
+
+    python benchmarks/bench_keyword_generation.py [number of prompts] [seconds per response]
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from keyword_maker import generate_keywords_async
+
+META_PROMPT = "Give the keywords in a json format."
+
+
+def start_stub_server(delay: float) -> str:
+    """Starts the stub Ollama server in a background thread and returns its URL."""
+
+    async def chat_handler(request: web.Request) -> web.Response:
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        await asyncio.sleep(delay)
+        content = "<think>...</think>\n```json\n" + json.dumps({"keywords": [prompt.split()[-1]]}) + "\n```"
+        return web.json_response({
+            "model": body["model"],
+            "created_at": "2025-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+        })
+
+    loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_post("/api/chat", chat_handler)
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    host = start_stub_server(delay)
+    prompts = [f"Give keywords relative to the word:\nkeyword{i}" for i in range(n)]
+
+    for concurrency in (1, 4, 8):
+        start = time.perf_counter()
+        results = asyncio.run(generate_keywords_async(prompts, META_PROMPT, model_name="stub", concurrency=concurrency, host=host))
+        elapsed = time.perf_counter() - start
+        in_order = results == [[f"keyword{i}"] for i in range(n)]
+        print(f"concurrency {concurrency}: {n} prompts in {elapsed:.2f}s, results in order: {in_order}")
+
+
+if __name__ == "__main__":
+    main()
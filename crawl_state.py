@@ -0,0 +1,170 @@
+import json
+import os
+import sqlite3
+import threading
+
+from datetime import datetime
+
+CRAWL_STATE_PATH = "out/crawl_state.sqlite"
+
+
+class CrawlState:
+    """Progress of a search crawl, stored in SQLite so that an interrupted crawl can resume.
+
+    The state records the end of the searched period, the planned search windows (and
+    every window count already requested while planning), the cursor of the last page fetched in each window and the
+    repositories fetched so far. Each page is saved with its cursor in one transaction, so
+    a restarted crawl continues after the last saved page without repeating any request.
+    A crawl is resumed until finish() is called; the next crawl of the keyword starts over.
+    """
+
+    def __init__(self, keyword: str, path: str = CRAWL_STATE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS crawls (
+                id INTEGER PRIMARY KEY,
+                keyword TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                finished_at TEXT,
+                end_date TEXT
+            );
+            CREATE TABLE IF NOT EXISTS counts (
+                crawl INTEGER NOT NULL,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (crawl, start, end)
+            );
+            CREATE TABLE IF NOT EXISTS windows (
+                crawl INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                cursor TEXT NOT NULL DEFAULT '',
+                pages INTEGER NOT NULL DEFAULT 0,
+                done INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (crawl, position)
+            );
+            CREATE TABLE IF NOT EXISTS repositories (
+                crawl INTEGER NOT NULL,
+                id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                rank INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (crawl, id)
+            );
+        """)
+        if "end_date" not in [column for (_, column, *_) in self.connection.execute("PRAGMA table_info(crawls)")]:
+            # State files created before the end date was recorded
+            self.connection.execute("ALTER TABLE crawls ADD COLUMN end_date TEXT")
+            self.connection.commit()
+
+        self.keyword = keyword
+        row = self.connection.execute(
+            "SELECT id FROM crawls WHERE keyword = ? AND finished_at IS NULL ORDER BY id DESC", (keyword,)
+        ).fetchone()
+        if row:
+            self.crawl_id = row[0]
+            print(f"Resuming the crawl {self.crawl_id} for: {keyword}")
+        else:
+            cursor = self.connection.execute(
+                "INSERT INTO crawls (keyword, started_at) VALUES (?, ?)", (keyword, datetime.now().isoformat())
+            )
+            self.connection.commit()
+            self.crawl_id = cursor.lastrowid
+
+    def get_end_date(self, end_date: datetime) -> datetime:
+        """The end of the searched period: the given one the first time, then the one recorded for the crawl.
+
+        Counts are saved by window, so a resumed crawl must split the same period to find them.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT end_date FROM crawls WHERE id = ?", (self.crawl_id,)).fetchone()
+            if row and row[0]:
+                return datetime.fromisoformat(row[0])
+            self.connection.execute("UPDATE crawls SET end_date = ? WHERE id = ?", (end_date.isoformat(), self.crawl_id))
+            self.connection.commit()
+        return end_date
+
+    def get_count(self, start: datetime, end: datetime) -> int | None:
+        row = self.connection.execute(
+            "SELECT count FROM counts WHERE crawl = ? AND start = ? AND end = ?",
+            (self.crawl_id, start.isoformat(), end.isoformat()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def save_count(self, start: datetime, end: datetime, count: int) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?)",
+                (self.crawl_id, start.isoformat(), end.isoformat(), count),
+            )
+            self.connection.commit()
+
+    def get_windows(self) -> list[tuple[datetime, datetime, int]] | None:
+        """The planned windows as (start, end, count), None if the crawl was not planned yet."""
+        rows = self.connection.execute(
+            "SELECT start, end, count FROM windows WHERE crawl = ? ORDER BY position", (self.crawl_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        return [(datetime.fromisoformat(start), datetime.fromisoformat(end), count) for start, end, count in rows]
+
+    def save_windows(self, windows: list[tuple[datetime, datetime, int]]) -> None:
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO windows (crawl, position, start, end, count) VALUES (?, ?, ?, ?, ?)",
+                [(self.crawl_id, position, start.isoformat(), end.isoformat(), count) for position, (start, end, count) in enumerate(windows)],
+            )
+            self.connection.commit()
+
+    def get_progress(self, position: int) -> tuple[str, int, bool]:
+        """The cursor after the last page saved in a window, the number of pages saved and whether it is done."""
+        row = self.connection.execute(
+            "SELECT cursor, pages, done FROM windows WHERE crawl = ? AND position = ?", (self.crawl_id, position)
+        ).fetchone()
+        if row is None:
+            return "", 0, False
+        cursor, pages, done = row
+        return cursor, pages, bool(done)
+
+    def save_page(self, position: int, repositories: list[dict], cursor: str, done: bool) -> None:
+        """Saves the repositories of a page and the cursor of the next one in a single transaction."""
+        with self.lock:
+            rank = self.connection.execute(
+                "SELECT COUNT(*) FROM repositories WHERE crawl = ? AND position = ?", (self.crawl_id, position)
+            ).fetchone()[0]
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO repositories VALUES (?, ?, ?, ?, ?)",
+                [
+                    (self.crawl_id, repository["id"], position, rank + i, json.dumps(repository))
+                    for i, repository in enumerate(repositories)
+                ],
+            )
+            self.connection.execute(
+                "UPDATE windows SET cursor = ?, pages = pages + 1, done = ? WHERE crawl = ? AND position = ?",
+                (cursor, int(done), self.crawl_id, position),
+            )
+            self.connection.commit()
+
+    def get_repositories(self) -> list[dict]:
+        """Every repository fetched by the crawl, in window and page order."""
+        rows = self.connection.execute(
+            "SELECT data FROM repositories WHERE crawl = ? ORDER BY position, rank", (self.crawl_id,)
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def finish(self) -> None:
+        """Marks the crawl as finished, the next crawl of the keyword will start over."""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE crawls SET finished_at = ? WHERE id = ?", (datetime.now().isoformat(), self.crawl_id)
+            )
+            self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
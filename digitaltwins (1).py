@@ -1,8 +1,14 @@
 import requests
+import asyncio
 import csv
 import time
 import pandas as pd
 import matplotlib.pyplot as plt
+from repository_counts import get_repository_counts
+from software_heritage_scraper import search_projects_by_metadata
+from github_session import GitHubSession
+from repository_enrichment import enrich_repositories, parse_repository_pair
+from repository_merge import Source, canonical_url, merge_sources
 
 GITHUB_TOKEN = ""
 
@@ -10,6 +16,9 @@ GITHUB_TOKEN = ""
 
 HEADERS = {"Authorization": f"token {GITHUB_TOKEN}"}
 
+session = requests.Session()
+session.headers.update(HEADERS)
+
 QUERY = "digital twin"
 MAX_RESULTS = 2000
 PER_PAGE = 100
@@ -44,18 +53,7 @@ def search_github_repositories(query, max_results=500, per_page=100, sort_by="st
     return repositories[:max_results]
 
 def get_repository_details(repo):
-    repo_url = repo['url']
-    contributors_url = repo_url + "/contributors"
-    commits_url = repo_url + "/commits"
-
-    try:
-        contributors_response = requests.get(contributors_url, headers=HEADERS)
-        commits_response = requests.get(commits_url, headers=HEADERS)
-        contributors_count = len(contributors_response.json()) if contributors_response.status_code == 200 else 0
-        commits_count = len(commits_response.json()) if commits_response.status_code == 200 else 0
-    except requests.exceptions.JSONDecodeError:
-        contributors_count = 0
-        commits_count = 0
+    contributors_count, commits_count = get_repository_counts(session, repo['url'])
 
     open_issues_count = repo['open_issues_count']
 
@@ -91,33 +89,8 @@ print("The results were saved in 'digital_twin_repos_gitHub.csv'")
 We will now move on to the Software Heritage search.
 """
 
-def search_projects_by_metadata():
-    metarequest = 0
-    projects = []
-    base_url = "https://archive.softwareheritage.org/api/1/origin/metadata-search/"
-    params = {"fulltext": {QUERY}, "per_page": 50}
-    next_page = base_url
-
-    while next_page and metarequest < MAX_RESULTS:
-        metarequest += 50
-        response = requests.get(next_page, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            projects.extend(data)  # Ajouter les résultats
-            # L'API de Software Heritage ne fournit pas toujours un lien "next"
-            if len(data) < 50:
-                break  # Plus de pages à récupérer
-
-            time.sleep(1)
-
-        else:
-            print("Erreur lors de la requête:", response.status_code, response.text)
-            break
-
-    return projects
-
 print(f"Search Software Heritage projects for : {QUERY}")
-projects_metadata = search_projects_by_metadata()
+projects_metadata = search_projects_by_metadata(QUERY)
 print(f"{len(projects_metadata)} projects found.")
 df = pd.DataFrame(projects_metadata)
 file_path = "digital_twin_repos_softwareHeritage.csv"
@@ -135,10 +108,11 @@ file_repos_softwareHeritage = "out/digital_twin_repos_softwareHeritage.csv"
 df_repos_gitHub = pd.read_csv(file_repos_gitHub)
 df_repos_softwareHeritage = pd.read_csv(file_repos_softwareHeritage)
 
-df_repos_gitHub["URL"] = df_repos_gitHub["URL"].str.lower().str.strip()
-df_repos_softwareHeritage["url"] = df_repos_softwareHeritage["url"].str.lower().str.strip()
+# Canonical URLs ignore the scheme, "www.", the case and the ".git" suffix
+df_repos_gitHub["canonical_url"] = df_repos_gitHub["URL"].map(canonical_url)
+df_repos_softwareHeritage["canonical_url"] = df_repos_softwareHeritage["url"].map(canonical_url)
 
-duplicates = df_repos_gitHub[df_repos_gitHub["URL"].isin(df_repos_softwareHeritage["url"])]
+duplicates = df_repos_gitHub[df_repos_gitHub["canonical_url"].isin(set(df_repos_softwareHeritage["canonical_url"]))]
 
 output_file = "out/duplicate_repositories.csv"
 duplicates.to_csv(output_file, index=False)
@@ -157,40 +131,37 @@ def extract_github_repo(url):
             return f"{parts[0]}/{parts[1]}"
     return None
 
-new_repos = df_repos_softwareHeritage[~df_repos_softwareHeritage["url"].isin(df_repos_gitHub["URL"])]
+new_repos = df_repos_softwareHeritage[~df_repos_softwareHeritage["canonical_url"].isin(set(df_repos_gitHub["canonical_url"]))]
 
 new_repos["github_repo"] = new_repos["url"].apply(extract_github_repo)
 new_repos = new_repos.dropna(subset=["github_repo"])
 
 """We have all the url of the new repo github not already recovered"""
 
-def collectDataFromRepo(repos,headers=HEADERS):
-  repo_data = []
+def collectDataFromRepo(repos):
+  """Fetches the GitHub data of the repositories, 50 per GraphQL request."""
+  async def fetch():
+    async with GitHubSession(GITHUB_TOKEN) as github_session:
+      return await enrich_repositories(pairs, github_session, with_contributors=True)
 
-  for repo in repos["github_repo"]:
-    url = f"https://api.github.com/repos/{repo}"
+  pairs = [parse_repository_pair(repo) for repo in repos["github_repo"]]
+  repositories, report = asyncio.run(fetch())
+  for entry in report:
+    print(f"{entry['requested']} : {entry['status']} {entry.get('url', entry.get('reason'))}")
 
-    try:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            repo_data.append({
-                "Name": data.get("name"),
-                "Stars": data.get("stargazers_count"),
-                "Forks": data.get("forks_count"),
-                "Language": data.get("language"),
-                "Description": data.get("description"),
-                "URL": data.get("html_url"),
-                "Contributors": len(requests.get(data["contributors_url"], headers=headers).json()),
-                "Commits": len(requests.get(data["commits_url"].replace("{/sha}", ""), headers=headers).json()),
-                "Open Issues": data.get("open_issues_count"),
-            })
-        else:
-            print(f"Error for {repo} : {response.status_code}")
-    except Exception as e:
-        print(f"Exception for {repo} : {e}")
-
-    time.sleep(1)
+  repo_data = []
+  for data in repositories:
+    repo_data.append({
+        "Name": data["name"],
+        "Stars": data["stargazerCount"],
+        "Forks": data["forkCount"],
+        "Language": data["languages"]["edges"][0]["node"]["name"] if data["languages"]["edges"] else None,
+        "Description": data["description"],
+        "URL": data["url"],
+        "Contributors": data["contributors"],
+        "Commits": data["commits"],
+        "Open Issues": data["open_issues"],
+    })
 
   return repo_data
 
@@ -210,8 +181,11 @@ We'll now take a look at some key data on recovered repositories
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-# Fusionner les DataFrames sur la colonne 'URL'
-merged_df = df_repos_gitHub.set_index('URL').combine_first(df_new_repos.set_index('URL')).reset_index()
+# Merge the repositories on their canonical URL, the GitHub search results having priority
+merged_df = pd.DataFrame(merge_sources([
+    Source("github", df_repos_gitHub.drop(columns="canonical_url").to_dict("records"), url_field="URL", id_field=None),
+    Source("software_heritage", df_new_repos.to_dict("records"), url_field="URL", id_field=None),
+])).drop(columns="provenance")
 
 print(df_repos_gitHub.info())
 print(df_new_repos.info())
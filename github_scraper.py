@@ -1,12 +1,59 @@
 import os
-import requests
 import csv
 import json
+import asyncio
+
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, NamedTuple
+from gql import GraphQLRequest, gql
+from github_session import GitHubSession, RATE_LIMIT_FIELD, create_aliased_request
+from repository_counts import get_repository_counts_async
+from crawl_state import CrawlState
+
+# Number of aliased repositories resolved by a single GraphQL request
+LATEST_COMMIT_BATCH_SIZE = 50
+
+# GitHub never returns more than 1000 results for a single search query
+SEARCH_RESULTS_LIMIT = 1000
+# Date format accepted by the pushed: qualifier, down to the second
+SEARCH_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+SEARCH_START_DATE = datetime(2014, 1, 1, tzinfo=timezone.utc)
+# Number of search windows fetched at the same time
+SEARCH_CONCURRENCY = 4
+# Number of fetched pages waiting to be consumed when the search is streamed
+SEARCH_QUEUE_SIZE = 8
+
+# Fields fetched for every repository, by the search and by the aliased queries
+REPOSITORY_FIELDS = """
+    name
+    owner { login }
+    description
+    url
+    id
+    archivedAt
+    createdAt
+    pushedAt
+    diskUsage
+    isFork
+    stargazerCount
+    forkCount
+    languages(first:10,orderBy:{field:SIZE,direction:DESC}) {
+        edges {
+            node {
+                name
+            }
+            size
+        }
+    }
+"""
+
+
+class SearchWindow(NamedTuple):
+    """A period of the pushed: qualifier and the number of repositories it matches."""
+    start: datetime
+    end: datetime
+    count: int
 
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
-from gql import Client, gql
-from gql.transport.aiohttp import AIOHTTPTransport
 
 def is_github_token_present() -> bool:
     """Verifies if the GITHUB_TOKEN variable is set."""
@@ -27,92 +74,162 @@ def get_github_token() -> str:
     return ""
 
 
-def create_client(github_token: str) -> Client:
-    transport = AIOHTTPTransport(
-        url="https://api.github.com/graphql",
-        headers={"Authorization": f"bearer {github_token}"},
-    )
-
-    return Client(transport=transport)
-
-
-async def get_repository_count(keyword: str, client: Client) -> int:
+async def get_repository_count(keyword: str, session: GitHubSession) -> int:
     """Runs a small query to get the repositoryCount value."""
     query = gql("""
         query getReposCount ($query: String!) {
             search(type:REPOSITORY, query:$query) {
                 repositoryCount
             }
-        }""")
-    query.variable_values = {
+            %s
+        }""" % RATE_LIMIT_FIELD)
+    request = GraphQLRequest(query, variable_values={
         "query": keyword
-    }
-    async with client as session:
-        dataFetched = False
-        while not dataFetched:
-            try:
-                result = await session.execute(query)
-                dataFetched = True
-            except TimeoutError:
-                print("TimeoutError: Attempting the query until data is fetched.")
+    })
+    result = await session.execute(request)
     return result["search"]["repositoryCount"]
 
 
-async def get_repositories_for_period(start_date: datetime, end_date: datetime, date_format: str, query, keyword: str, client: Client) -> list:
+async def iter_pages_for_period(start_date: datetime, end_date: datetime, date_format: str, query, keyword: str, session: GitHubSession, state: CrawlState | None = None, position: int = 0) -> AsyncIterator[list]:
+    """Yields the pages of repositories of a period as soon as they are fetched.
+
+    When a crawl state is given, each page is saved in it with the cursor of the next one,
+    and the period is resumed after the last saved page. Only the pages fetched by this
+    call are yielded.
+    """
     allDataFetched = False
     start_string = start_date.strftime(date_format)
     end_string = end_date.strftime(date_format)
 
-    repositories = []
     cursor = ""
     n = 1
+    if state is not None:
+        cursor, pages, allDataFetched = state.get_progress(position)
+        n = pages + 1
     
     while not allDataFetched:
-        # Set the variables
-        query.variable_values = {
+        # Set the variables on a copy of the query, which is shared by the concurrent windows
+        request = GraphQLRequest(query, variable_values={
             "query": f"{keyword} sort:updated-asc pushed:{start_string}..{end_string}",
             "cursor": cursor
-        }
+        })
 
         # Get the data
-        async with client as session:
-            dataFetched = False
-            while not dataFetched:
-                try:
-                    result = await session.execute(query)
-                    dataFetched = True
-                except TimeoutError:
-                    print("TimeoutError: Attempting the query until data is fetched.")
+        result = await session.execute(request)
 
         results = result["search"]["edges"]
         # Get the number of repos
         count = result["search"]["repositoryCount"]
         print(f"{count} repositories found for the given period{f" {n}/{count//100+1}" if count > 100 else ""}")
 
-        # Add the repos to the final list of repos
-        for repository in results:
-            repositories.append(repository["node"])
+        page = [repository["node"] for repository in results]
+        for repository in page:
+            set_latest_commit_from_node(repository)
 
         # If more than 100 repos, set the cursor at the latest repo in the results, else, we end the loop
-        if n <= count // 100:
+        if n <= count // 100 and results:
             cursor = results[-1]["cursor"]
             n += 1
         else:
             allDataFetched = True
 
-    return repositories
-
+        if state is not None:
+            state.save_page(position, page, cursor, allDataFetched)
+        yield page
 
 
-async def search_github_repositories(keyword: str, github_token: str) -> list:
-    print(f"Searching GitHub projects corresponding to: {keyword}")
-
-    client = create_client(github_token=github_token)
-    repository_count = await get_repository_count(keyword=keyword, client=client)
+async def get_repositories_for_period(start_date: datetime, end_date: datetime, date_format: str, query, keyword: str, session: GitHubSession, state: CrawlState | None = None, position: int = 0) -> list:
+    """Fetches every page of repositories of a period, see iter_pages_for_period."""
+    repositories = []
+    async for page in iter_pages_for_period(start_date, end_date, date_format, query, keyword, session, state, position):
+        # Add the repos to the final list of repos
+        repositories.extend(page)
+    return repositories
 
-    print(f"{repository_count} repositories found. Fetching the data...")
 
-    query = gql("""
+async def count_search_window(keyword: str, start_date: datetime, end_date: datetime, session: GitHubSession, state: CrawlState | None = None) -> SearchWindow:
+    """Counts the repositories matching the keyword that were pushed during the given period."""
+    if state is not None:
+        count = state.get_count(start_date, end_date)
+        if count is not None:
+            return SearchWindow(start_date, end_date, count)
+
+    start_string = start_date.strftime(SEARCH_DATE_FORMAT)
+    end_string = end_date.strftime(SEARCH_DATE_FORMAT)
+    count = await get_repository_count(keyword=f"{keyword} pushed:{start_string}..{end_string}", session=session)
+    if state is not None:
+        state.save_count(start_date, end_date, count)
+    return SearchWindow(start_date, end_date, count)
+
+
+def merge_search_windows(windows: list[SearchWindow], limit: int = SEARCH_RESULTS_LIMIT) -> list[SearchWindow]:
+    """Merges consecutive windows as long as the merged window stays under the results limit.
+
+    The windows are disjoint, so the count of a merged window is the sum of their counts.
+    """
+    merged: list[SearchWindow] = []
+    for window in windows:
+        if merged and merged[-1].count + window.count < limit:
+            previous = merged.pop()
+            window = SearchWindow(previous.start, window.end, previous.count + window.count)
+        merged.append(window)
+    return merged
+
+
+async def plan_search_windows(keyword: str, session: GitHubSession, start_date: datetime = SEARCH_START_DATE, end_date: datetime | None = None, min_window: timedelta = timedelta(hours=1), state: CrawlState | None = None) -> list[SearchWindow]:
+    """Splits a period into windows that each match fewer than SEARCH_RESULTS_LIMIT repositories.
+
+    Windows over the limit are bisected until they fit or reach min_window. Only the
+    first half of each split is counted, the second half is deduced from the parent
+    count. Consecutive small windows are then merged so that empty or sparse periods
+    do not cost a page each.
+
+    With a crawl state, the end date, the plan and the counts requested while planning are
+    saved, and the plan of an interrupted crawl is reused.
+    """
+    if state is not None and state.get_windows() is not None:
+        return [SearchWindow(*window) for window in state.get_windows()]
+
+    if end_date is None:
+        end_date = datetime.now(timezone.utc).replace(microsecond=0)
+    if state is not None:
+        # An interrupted planning resumes on the same period, whose counts are saved
+        end_date = state.get_end_date(end_date)
+
+    windows: list[SearchWindow] = []
+    pending = [await count_search_window(keyword, start_date, end_date, session, state)]
+
+    while pending:
+        window = pending.pop()
+        if window.count < SEARCH_RESULTS_LIMIT:
+            windows.append(window)
+            continue
+        if window.end - window.start <= min_window:
+            print(f"Warning: {window.count} repositories pushed between {window.start} and {window.end}, only {SEARCH_RESULTS_LIMIT} can be fetched.")
+            windows.append(window)
+            continue
+
+        middle = (window.start + (window.end - window.start) / 2).replace(microsecond=0)
+        first_half = await count_search_window(keyword, window.start, middle, session, state)
+        second_half = SearchWindow(middle + timedelta(seconds=1), window.end, max(window.count - first_half.count, 0))
+        print(f"Splitting {window.start} - {window.end} ({window.count} repositories) at {middle}")
+
+        # The first half is processed first so that the windows stay in chronological order
+        pending.append(second_half)
+        pending.append(first_half)
+
+    windows = merge_search_windows(windows)
+    if state is not None:
+        state.save_windows(windows)
+    return windows
+
+
+def create_search_query(with_latest_commit: bool = False):
+    """Creates the getRepos query, fetching a page of 100 repositories of a search."""
+    # The head of the default branch is fetched with the search results so
+    # that no extra request is needed to link to the latest commit.
+    latest_commit_field = "defaultBranchRef { target { oid } }" if with_latest_commit else ""
+    return gql("""
         query getRepos ($query: String!, $cursor: String = "") {
             search(type:REPOSITORY, query:$query, first:100, after:$cursor) {
                 repositoryCount
@@ -120,114 +237,155 @@ async def search_github_repositories(keyword: str, github_token: str) -> list:
                     cursor
                     node {
                         ... on Repository {
-                            name
-                            owner { login }
-                            description
-                            url
-                            id
-                            archivedAt
-                            createdAt
-                            pushedAt
-                            diskUsage
-                            isFork
-                            stargazerCount
-                            forkCount
-                            languages(first:10,orderBy:{field:SIZE,direction:DESC}) {
-                                edges {
-                                    node {
-                                        name
-                                    }
-                                    size
-                                }
-                            }
+                            %s
+                            %s
                         }
                     }
                 }
             }
-        }""")
-    
-    repositories: list = []
-    date_format = "%Y-%m-%d"
-    today = datetime.now()
-    start_date = datetime.strptime("2014-01-01", date_format)
-    end_date = start_date + relativedelta(day=31)
+            %s
+        }""" % (REPOSITORY_FIELDS, latest_commit_field, RATE_LIMIT_FIELD))
+
+
+async def iter_search_pages(keyword: str, session: GitHubSession, with_latest_commit: bool = False, concurrency: int = SEARCH_CONCURRENCY, state: CrawlState | None = None, start_date: datetime = SEARCH_START_DATE, queue_size: int = SEARCH_QUEUE_SIZE) -> AsyncIterator[tuple[int, int, list]]:
+    """Yields the pages of repositories of a search as (window index, page number, page), as soon as they are fetched.
+
+    Each window is fetched by one of concurrency workers, its pages sequentially because
+    of the cursors, so the pages of different windows come in no particular order; their
+    window index and page number give the order of the search. At most queue_size pages
+    wait for the consumer: the workers stop fetching while it is busy, which bounds the
+    memory used.
+    """
+    query = create_search_query(with_latest_commit)
+    windows = await plan_search_windows(keyword=keyword, session=session, start_date=start_date, state=state)
+    print(f"{sum(window.count for window in windows)} repositories found in {len(windows)} search windows. Fetching the data...")
+
+    windows_queue: asyncio.Queue = asyncio.Queue()
+    for index, window in enumerate(windows):
+        if window.count > 0 and (state is None or not state.get_progress(index)[2]):
+            windows_queue.put_nowait((index, window))
+    pages: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def worker() -> None:
+        while not windows_queue.empty():
+            index, window = windows_queue.get_nowait()
+            print(f"Requesting repositories from {window.start.strftime(SEARCH_DATE_FORMAT)} to {window.end.strftime(SEARCH_DATE_FORMAT)}")
+            page_number = 0
+            async for page in iter_pages_for_period(start_date=window.start, end_date=window.end, date_format=SEARCH_DATE_FORMAT, query=query, keyword=keyword, session=session, state=state, position=index):
+                await pages.put((index, page_number, page))
+                page_number += 1
+
+    async def run_workers() -> None:
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+        finally:
+            # Tells the consumer that there are no more pages
+            await pages.put(None)
 
-    while start_date < today:
-        start_string = start_date.strftime(date_format)
-        end_string = end_date.strftime(date_format)
-        print(f"Requesting repositories from {start_string} to {end_string}")
+    producer = asyncio.create_task(run_workers())
+    try:
+        while (page := await pages.get()) is not None:
+            yield page
+        # Raises the error of a worker, if any
+        await producer
+    finally:
+        producer.cancel()
 
-        results_from_period = await get_repositories_for_period(start_date=start_date, end_date=end_date, date_format=date_format, query=query, keyword=keyword, client=client)
 
-        # Add the repos to the final list of repos
-        repositories.extend(results_from_period)
+async def search_github_repositories(keyword: str, session: GitHubSession, with_latest_commit: bool = False, concurrency: int = SEARCH_CONCURRENCY, state: CrawlState | None = None, start_date: datetime = SEARCH_START_DATE) -> list:
+    print(f"Searching GitHub projects corresponding to: {keyword}")
+
+    # Pages are collected by window and page number to keep the order of the search
+    fetched: dict[tuple[int, int], list] = {}
+    async for index, page_number, page in iter_search_pages(keyword, session, with_latest_commit=with_latest_commit, concurrency=concurrency, state=state, start_date=start_date):
+        fetched[(index, page_number)] = page
 
-        # Increment the dates
-        start_date += relativedelta(months=1)
-        end_date = start_date + relativedelta(day=31)
+    today = datetime.now()
+    if state is not None:
+        # The state also holds the repositories fetched before an interruption
+        repositories = state.get_repositories()
+    else:
+        repositories = [repository for position in sorted(fetched) for repository in fetched[position]]
 
     # TEMP: save to file
     with open(f"out/digital_twin_repos_github_{today.strftime("%Y%m%d_%H%M%S")}.json", 'w', encoding='utf-8') as file:
         json.dump(repositories, file, indent=4)
-    
+
+    if state is not None:
+        state.finish()
     return repositories
 
 
-def get_latest_hash(owner, repo_name, github_token: str) -> str:
-    """Gets the latest hash 'sha' for a given repository."""
-    request_url = f"https://api.github.com/repos/{owner}/{repo_name}/commits?per_page=1"
+def set_latest_commit(repository: dict, sha: str) -> None:
+    """Stores the latest commit sha of a repository and the link to its tree."""
+    owner = repository["owner"]["login"]
+    repo_name = repository["name"]
+    repository["latest_commit"] = sha
+    repository["link_to_latest_commit"] = f"https://github.com/{owner}/{repo_name}/tree/{sha}"
 
-    headers = {
-        "Accept": "application/vnd.github+json",
-        "X-GitHub-Api-Version": "2022-11-28",
-        "Authorization": f"Bearer {github_token}"
-    }
 
-    dataFetched = False
-    while not dataFetched:
-        try:
-            response = requests.get(request_url, headers=headers)
-            dataFetched = True
-        except requests.exceptions.SSLError:
-            print("SSLError: retrying...")
+def set_latest_commit_from_node(repository: dict) -> None:
+    """Moves the default branch head fetched by the getRepos query to the latest_commit fields.
+
+    Repositories without a default branch (e.g. empty repositories) are left untouched
+    so that they can be resolved later by get_latest_hashes.
+    """
+    branch = repository.pop("defaultBranchRef", None)
+    if branch and branch.get("target"):
+        set_latest_commit(repository, branch["target"]["oid"])
 
 
-    if response.status_code != 200:
+async def get_latest_hashes(repositories: list, session: GitHubSession, batch_size: int = LATEST_COMMIT_BATCH_SIZE) -> None:
+    """Resolves the latest commit sha of many repositories using aliased GraphQL queries.
+
+    Each request resolves up to batch_size repositories. Repositories that cannot be
+    resolved (empty, deleted or inaccessible) get an empty sha, like get_latest_hash; a
+    request that fails as a whole raises.
+    """
+    for start in range(0, len(repositories), batch_size):
+        batch = repositories[start:start + batch_size]
+        print(f"Getting sha for repositories {start}-{start + len(batch)}/{len(repositories)}")
+
+        request = create_aliased_request(
+            "getLatestHashes",
+            [(repository["owner"]["login"], repository["name"]) for repository in batch],
+            "defaultBranchRef { target { oid } }",
+        )
+
+        result, _ = await session.execute_aliased(request)
+
+        for i, repository in enumerate(batch):
+            node = result.get(f"repo{i}")
+            repository["defaultBranchRef"] = node["defaultBranchRef"] if node else None
+            set_latest_commit_from_node(repository)
+            if "latest_commit" not in repository:
+                set_latest_commit(repository, "")
+
+
+async def get_latest_hash(owner, repo_name, session: GitHubSession) -> str:
+    """Gets the latest hash 'sha' for a given repository."""
+    status, _, data = await session.get(f"/repos/{owner}/{repo_name}/commits", params={"per_page": 1})
+
+    if status != 200 or not data:
         return ""
-    
-    try:
-        data = response.json()
-        return data[0]["sha"]
-    except requests.exceptions.JSONDecodeError:
-        print("Error: Empty or badly formatted response received from GitHub API")
 
-def get_repository_details(repo, github_token: str):
-    repo_url = repo['url']
-    contributors_url = repo_url + "/contributors"
-    commits_url = repo_url + "/commits"
-    headers = {"Authorization": f"token {github_token}"}
+    return data[0]["sha"]
 
-    try:
-        contributors_response = requests.get(contributors_url, headers=headers)
-        commits_response = requests.get(commits_url, headers=headers)
-        contributors_count = len(contributors_response.json()) if contributors_response.status_code == 200 else 0
-        commits_count = len(commits_response.json()) if commits_response.status_code == 200 else 0
-    except requests.exceptions.JSONDecodeError:
-        contributors_count = 0
-        commits_count = 0
+async def get_repository_details(repo, session: GitHubSession):
+    contributors_count, commits_count = await get_repository_counts_async(session, repo['url'])
 
     open_issues_count = repo['open_issues_count']
 
     return contributors_count, commits_count, open_issues_count
 
-def save_to_csv(repositories, filename="digital_twin_repos_github", github_token: str=""):
+async def save_to_csv(repositories, session: GitHubSession, filename="digital_twin_repos_github"):
     now = datetime.now().strftime("%Y%m%d")
     with open(f"out/{filename}_{now}.csv", mode='w', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
         writer.writerow(["Name", "Stars", "Forks", "Language", "Description", "URL", "Contributors", "Commits", "Open Issues"])
 
         for repo in repositories:
-            contributors, commits, open_issues = get_repository_details(repo, github_token=github_token)
+            contributors, commits, open_issues = await get_repository_details(repo, session=session)
             writer.writerow([
                 repo['name'],
                 repo['stargazers_count'],
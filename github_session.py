@@ -0,0 +1,213 @@
+import json
+import time
+import aiohttp
+
+from typing import Any
+from urllib.parse import urlencode
+from gql import Client, GraphQLRequest
+from gql.transport.aiohttp import AIOHTTPTransport
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+from rate_limiter import is_rate_limited
+from token_pool import TokenPool
+from http_cache import HttpCache
+
+GITHUB_API_URL = "https://api.github.com"
+# Maximum number of connections opened at the same time to the API
+CONNECTION_POOL_SIZE = 10
+# Number of seconds an idle connection is kept open for reuse
+KEEPALIVE_TIMEOUT = 60
+# Field to add to every GraphQL query so that the scheduler knows the remaining quota
+RATE_LIMIT_FIELD = "rateLimit { cost remaining resetAt }"
+# Number of seconds a token is parked after a rate limit error that does not tell the reset time
+RATE_LIMIT_RETRY_DELAY = 60
+
+
+def create_client(github_token: str, api_url: str = GITHUB_API_URL, client_session_args: dict | None = None) -> Client:
+    transport = AIOHTTPTransport(
+        url=f"{api_url}/graphql",
+        headers={"Authorization": f"bearer {github_token}"},
+        client_session_args=client_session_args,
+    )
+
+    return Client(transport=transport)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Tells if a GraphQL request was rejected by the primary or a secondary rate limit."""
+    if isinstance(error, TransportQueryError):
+        return any(isinstance(item, dict) and item.get("type") == "RATE_LIMITED" for item in error.errors or [])
+    return isinstance(error, TransportServerError) and error.code in (403, 429)
+
+
+def get_error_types(error: TransportQueryError) -> dict[str, str]:
+    """Gets the type of the error (e.g. NOT_FOUND) reported for each alias of a query."""
+    types = {}
+    for entry in error.errors or []:
+        path = entry.get("path") or []
+        if path:
+            types[path[0]] = entry.get("type", "ERROR")
+    return types
+
+
+def create_aliased_request(operation_name: str, repositories: list[tuple[str, str]], fields: str) -> GraphQLRequest:
+    """Creates a query selecting the same fields on many repositories, aliased repo0, repo1, ...
+
+    The repositories are given as (owner, name) pairs and passed as variables.
+    """
+    variables = ", ".join(f"$owner{i}: String!, $name{i}: String!" for i in range(len(repositories)))
+    aliases = "\n".join(
+        f"repo{i}: repository(owner: $owner{i}, name: $name{i}) {{ {fields} }}"
+        for i in range(len(repositories))
+    )
+    variable_values = {}
+    for i, (owner, name) in enumerate(repositories):
+        variable_values[f"owner{i}"] = owner
+        variable_values[f"name{i}"] = name
+    return GraphQLRequest(f"query {operation_name} ({variables}) {{\n{aliases}\n{RATE_LIMIT_FIELD}\n}}", variable_values=variable_values)
+
+
+class GitHubSession:
+    """A long-lived connection pool shared by every GraphQL and REST call of a crawl.
+
+    The connections are kept alive between requests, so the TLS handshake is only paid
+    once per pooled connection instead of once per page. Every call is sent with a token
+    of a TokenPool, which paces the calls and can be shared with other scrapers. REST
+    responses are revalidated with conditional requests when an HttpCache is given.
+
+        async with GitHubSession(TokenPool(get_github_tokens())) as session:
+            result = await session.execute(query)
+            status, headers, data = await session.get(url)
+    """
+
+    def __init__(self, tokens: TokenPool | str, pool_size: int = CONNECTION_POOL_SIZE, keepalive_timeout: float = KEEPALIVE_TIMEOUT, api_url: str = GITHUB_API_URL, cache: HttpCache | None = None):
+        self.tokens = tokens if isinstance(tokens, TokenPool) else TokenPool([tokens])
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.api_url = api_url
+        self.cache = cache
+
+    async def __aenter__(self) -> "GitHubSession":
+        self.connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout)
+        self.http = aiohttp.ClientSession(
+            connector=self.connector,
+            connector_owner=False,
+            headers={
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+            },
+        )
+        # The GraphQL transport opens its own aiohttp session on the same connector,
+        # the token is set on each request
+        self.client = create_client(self.tokens.tokens[0], api_url=self.api_url, client_session_args={
+            "connector": self.connector,
+            "connector_owner": False,
+        })
+        self.graphql = await self.client.connect_async()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        # gql does not close its aiohttp session when it does not own the connector
+        graphql_http = self.client.transport.session
+        await self.client.close_async()
+        if graphql_http is not None:
+            await graphql_http.close()
+        await self.http.close()
+        await self.connector.close()
+
+    def authorization(self, token: str) -> dict:
+        return {"Authorization": f"Bearer {token}"} if token else {}
+
+    async def execute(self, request: GraphQLRequest) -> dict:
+        """Executes a GraphQL request, retrying until the data is fetched.
+
+        The quota is read from the rateLimit field when the query selects it (see RATE_LIMIT_FIELD).
+        A request rejected by a rate limit is sent again with another token, the token being
+        parked until its reset time, or for RATE_LIMIT_RETRY_DELAY seconds when it is unknown.
+        """
+        while True:
+            token = await self.tokens.acquire_async("graphql")
+            try:
+                result = await self.graphql.execute(request, extra_args={"headers": self.authorization(token)})
+            except TimeoutError:
+                print("TimeoutError: Attempting the query until data is fetched.")
+                continue
+            except (TransportQueryError, TransportServerError) as error:
+                data = getattr(error, "data", None)
+                if data and data.get("rateLimit"):
+                    self.tokens.update_from_graphql(token, data["rateLimit"])
+                if not is_rate_limit_error(error):
+                    raise
+                if self.tokens.parked_until(token, "graphql") <= time.monotonic():
+                    self.tokens.block(token, "graphql", RATE_LIMIT_RETRY_DELAY)
+                print("GraphQL rate limit exceeded. Retrying with the next available token...")
+                continue
+            if result.get("rateLimit"):
+                self.tokens.update_from_graphql(token, result["rateLimit"])
+            return result
+
+    async def execute_aliased(self, request: GraphQLRequest) -> tuple[dict, dict[str, str]]:
+        """Executes an aliased request (see create_aliased_request) and returns its data and the error type of each failed alias.
+
+        Missing repositories are reported as errors while the others are still in the data.
+        A request that failed as a whole, without any data, raises.
+        """
+        try:
+            return await self.execute(request), {}
+        except TransportQueryError as error:
+            if error.data is None:
+                raise
+            return error.data, get_error_types(error)
+
+    async def get(self, url: str, params: dict | None = None) -> tuple[int, dict, Any]:
+        """Sends a GET request to the REST API and returns its status, headers and JSON body.
+
+        The body is None when the response is empty or is not valid JSON.
+        """
+        if url.startswith("/"):
+            url = self.api_url + url
+        if params:
+            url = f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+        resource = "search" if url.startswith(f"{self.api_url}/search/") else "core"
+
+        while True:
+            token = await self.tokens.acquire_async(resource)
+            headers = self.authorization(token)
+            entry = None
+            if self.cache is not None:
+                # GitHub only answers a free 304 to the credentials that got the ETag
+                key = self.cache.key(url, headers.get("Authorization"))
+                entry = self.cache.get(key)
+                if entry is not None and self.cache.is_fresh(entry):
+                    self.cache.hits += 1
+                    return entry.status, entry.headers, self.parse_body(entry.body)
+            if entry is not None:
+                headers.update(entry.conditional_headers())
+            try:
+                async with self.http.get(url, headers=headers) as response:
+                    self.tokens.update_from_headers(token, response.headers, resource=resource)
+                    if is_rate_limited(response.status, response.headers):
+                        print(f"{resource.capitalize()} rate limit exceeded, waiting for the reset.")
+                        continue
+                    body = await response.read()
+            except aiohttp.ClientConnectionError as error:
+                print(f"{type(error).__name__}: retrying...")
+                continue
+
+            if self.cache is not None:
+                if response.status == 304 and entry is not None:
+                    self.cache.not_modified += 1
+                    self.cache.refresh(key)
+                    return entry.status, entry.headers, self.parse_body(entry.body)
+                self.cache.misses += 1
+                if response.status == 200:
+                    self.cache.put(key, url, response.status, response.headers, body)
+            return response.status, dict(response.headers), self.parse_body(body)
+
+    def parse_body(self, body: bytes) -> Any:
+        if not body.strip():
+            return None
+        try:
+            return json.loads(body)
+        except ValueError:
+            print("Error: Empty or badly formatted response received from GitHub API")
+            return None
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+HTTP_CACHE_PATH = "out/http_cache.sqlite"
+# The least recently used entries are evicted above this size (in bytes)
+HTTP_CACHE_MAX_SIZE = 512 * 1024 * 1024
+# Entries stored before this number of seconds are evicted
+HTTP_CACHE_MAX_AGE = 30 * 24 * 3600
+# Headers that describe the transfer or the quota rather than the cached body
+UNCACHED_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection", "date", "keep-alive"}
+
+
+class CacheEntry:
+    def __init__(self, status: int, headers: dict, body: bytes, etag: str | None, last_modified: str | None, stored_at: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+
+    def conditional_headers(self) -> dict:
+        """Headers that make the server answer 304 Not Modified if the body did not change."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """Persistent cache of GET responses revalidated with ETag and Last-Modified.
+
+    GitHub does not count the 304 Not Modified answers to conditional requests against
+    the quota, so revisiting an unchanged endpoint is free, but only when the conditional
+    request is sent with the Authorization that got the ETag: another token gets a 200
+    that costs quota. Entries are therefore keyed by URL and a hash of the credentials,
+    so each token of a pool revalidates its own entries, and are evicted by age and,
+    least recently used first, by total size. Responses younger than fresh_for seconds
+    are served without any request.
+    """
+
+    def __init__(self, path: str = HTTP_CACHE_PATH, max_size: int = HTTP_CACHE_MAX_SIZE, max_age: float = HTTP_CACHE_MAX_AGE, fresh_for: float = 0):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.max_age = max_age
+        self.fresh_for = fresh_for
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.evict()
+
+    def key(self, url: str, credentials: str | None = None) -> str:
+        """Key of a URL requested with the given credentials (e.g. the Authorization header)."""
+        scope = hashlib.sha256((credentials or "").encode()).hexdigest()[:16]
+        return hashlib.sha256(f"{scope} {url}".encode()).hexdigest()
+
+    def get(self, key: str) -> CacheEntry | None:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT status, headers, body, etag, last_modified, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+        status, headers, body, etag, last_modified, stored_at = row
+        return CacheEntry(status, json.loads(headers), body, etag, last_modified, stored_at)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.stored_at < self.fresh_for
+
+    def put(self, key: str, url: str, status: int, headers, body: bytes) -> None:
+        """Stores a response if it can be revalidated later."""
+        headers = {
+            name: value for name, value in headers.items()
+            if name.lower() not in UNCACHED_HEADERS and not name.lower().startswith("x-ratelimit")
+        }
+        lowered = {name.lower(): value for name, value in headers.items()}
+        etag = lowered.get("etag")
+        last_modified = lowered.get("last-modified")
+        if not etag and not last_modified:
+            return
+
+        now = time.time()
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if previous:
+                self.total_size -= previous[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status, json.dumps(headers), body, etag, last_modified, len(body), now, now),
+            )
+            self.connection.commit()
+            self.total_size += len(body)
+        if self.total_size > self.max_size:
+            self.evict()
+
+    def refresh(self, key: str) -> None:
+        """Marks an entry as revalidated by a 304 answer."""
+        with self.lock:
+            self.connection.execute("UPDATE responses SET stored_at = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+
+    def evict(self) -> None:
+        """Removes the entries older than max_age, then the least recently used ones above max_size."""
+        with self.lock:
+            self.connection.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.max_age,))
+            self.total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if self.total_size > self.max_size:
+                rows = self.connection.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+                evicted = []
+                for key, size in rows:
+                    if self.total_size <= self.max_size:
+                        break
+                    evicted.append((key,))
+                    self.total_size -= size
+                self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        """Number of responses served from the cache, fetched, and revalidated by a 304 answer."""
+        return {"hits": self.hits, "misses": self.misses, "not_modified": self.not_modified, "size": self.total_size}
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class CachingAdapter(HTTPAdapter):
+    """Transport adapter sending the GET requests of a requests.Session through an HttpCache.
+
+        session.mount("https://api.github.com/", CachingAdapter(HttpCache()))
+    """
+
+    def __init__(self, cache: HttpCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        key = self.cache.key(request.url, request.headers.get("Authorization"))
+        entry = self.cache.get(key)
+        if entry is not None and self.cache.is_fresh(entry):
+            self.cache.hits += 1
+            return self.build_response_from_cache(request, entry, {})
+        if entry is not None:
+            request.headers.update(entry.conditional_headers())
+
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            self.cache.not_modified += 1
+            self.cache.refresh(key)
+            return self.build_response_from_cache(request, entry, response.headers)
+
+        self.cache.misses += 1
+        if response.status_code == 200:
+            self.cache.put(key, request.url, response.status_code, response.headers, response.content)
+        return response
+
+    def build_response_from_cache(self, request: requests.PreparedRequest, entry: CacheEntry, headers) -> requests.Response:
+        """Creates the response of a cached entry, with the quota headers of the 304 answer if any."""
+        response = requests.Response()
+        response.status_code = entry.status
+        response.headers = CaseInsensitiveDict(entry.headers)
+        response.headers.update({name: value for name, value in headers.items() if name.lower().startswith("x-ratelimit")})
+        response._content = entry.body
+        response.url = request.url
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.reason = "OK"
+        return response
@@ -0,0 +1,180 @@
+import glob
+import json
+import os
+
+from datetime import datetime, timedelta, timezone
+from gql import GraphQLRequest
+from gql.transport.exceptions import TransportQueryError
+from github_scraper import search_github_repositories, get_latest_hashes, SEARCH_DATE_FORMAT
+from github_session import GitHubSession, RATE_LIMIT_FIELD
+from crawl_state import CrawlState
+
+SNAPSHOT_PATTERN = "digital_twin_repos_github_with_sha_*.json"
+SNAPSHOT_TIME_FORMAT = "%Y%m%d_%H%M%S"
+# Written next to each snapshot: the end of the period its search covered
+SNAPSHOT_INFO_PATTERN = "digital_twin_repos_github_info_*.json"
+# Repositories pushed shortly before the previous snapshot are fetched again, in case
+# the search index was not up to date when it was taken
+SNAPSHOT_OVERLAP = timedelta(hours=1)
+# Number of node ids checked by a single GraphQL request, the maximum allowed by GitHub
+NODES_BATCH_SIZE = 100
+
+
+def find_latest_snapshot(directory: str = "out") -> str | None:
+    """Finds the most recent snapshot written by main.py, None if there is none."""
+    snapshots = sorted(glob.glob(os.path.join(directory, SNAPSHOT_PATTERN)))
+    return snapshots[-1] if snapshots else None
+
+
+def get_snapshot_time(path: str) -> datetime:
+    """Gets the (UTC) time at which a snapshot was taken from its file name."""
+    timestamp = os.path.basename(path)[len(SNAPSHOT_PATTERN.split("*")[0]):-len(".json")]
+    return datetime.strptime(timestamp, SNAPSHOT_TIME_FORMAT).astimezone(timezone.utc)
+
+
+def get_searched_until(path: str) -> datetime:
+    """Gets the end of the period searched for a snapshot, the time it was written for the snapshots without it.
+
+    The search of a crawl only covers the pushes until its planning, which may be hours
+    before the snapshot is written, so the next update searches from this date.
+    """
+    timestamp = os.path.basename(path)[len(SNAPSHOT_PATTERN.split("*")[0]):-len(".json")]
+    info_path = os.path.join(os.path.dirname(path), SNAPSHOT_INFO_PATTERN.replace("*", timestamp))
+    if not os.path.exists(info_path):
+        return get_snapshot_time(path)
+    with open(info_path, encoding="utf-8") as file:
+        return datetime.fromisoformat(json.load(file)["searched_until"])
+
+
+def write_snapshot(repositories: list, searched_until: datetime, directory: str = "out") -> str:
+    """Writes a snapshot and the end of the period its search covered, and returns the timestamp of its name."""
+    now = datetime.now().strftime(SNAPSHOT_TIME_FORMAT)
+    with open(os.path.join(directory, SNAPSHOT_PATTERN.replace("*", now)), "w", encoding="utf-8") as file:
+        json.dump(repositories, file, indent=4)
+    with open(os.path.join(directory, SNAPSHOT_INFO_PATTERN.replace("*", now)), "w", encoding="utf-8") as file:
+        json.dump({"snapshot": SNAPSHOT_PATTERN.replace("*", now), "searched_until": searched_until.isoformat()}, file, indent=4)
+    return now
+
+
+async def get_existing_nodes(ids: list[str], session: GitHubSession) -> tuple[dict[str, str], set[str]]:
+    """Looks up repositories by node id: the pushedAt date of the ones found, and the ids GitHub reports as not found.
+
+    Only the nodes of an explicit NOT_FOUND error are deleted repositories. A request that
+    failed as a whole raises, rather than passing its repositories for deleted ones.
+    """
+    existing = {}
+    not_found = set()
+    for start in range(0, len(ids), NODES_BATCH_SIZE):
+        batch = ids[start:start + NODES_BATCH_SIZE]
+        request = GraphQLRequest("""
+            query getNodes ($ids: [ID!]!) {
+                nodes(ids: $ids) {
+                    ... on Repository { id pushedAt }
+                }
+                %s
+            }""" % RATE_LIMIT_FIELD, variable_values={"ids": batch})
+        try:
+            result = await session.execute(request)
+        except TransportQueryError as error:
+            if error.data is None:
+                raise
+            # Deleted repositories are reported as NOT_FOUND errors on their path and null nodes
+            result = error.data
+            for item in error.errors or []:
+                path = item.get("path") or []
+                if item.get("type") == "NOT_FOUND" and len(path) == 2 and path[0] == "nodes" and isinstance(path[1], int):
+                    not_found.add(batch[path[1]])
+
+        for node in result["nodes"]:
+            if node:
+                existing[node["id"]] = node["pushedAt"]
+    return existing, not_found
+
+
+async def update_snapshot(keyword: str, snapshot: list, since: datetime, session: GitHubSession, check_deleted: bool = True) -> tuple[list, list, datetime]:
+    """Updates a snapshot with the repositories pushed since the given time.
+
+    Only pushed:>since is searched, up to the end date planned for the search. The results
+    are merged with the snapshot by repository id, and the latest commit sha is resolved
+    again only for the repositories whose pushedAt moved. With check_deleted, the other
+    repositories of the snapshot are looked up by node id (100 per request): the ones
+    GitHub reports as not found are removed, and the ones pushed within the searched
+    period but not found by the search are reported as unmatched, since the search index
+    may lag or a window may be truncated. Returns the updated snapshot, its change log and
+    the end of the searched period.
+    """
+    print(f"Searching the repositories pushed since {since.strftime(SEARCH_DATE_FORMAT)}")
+    state = CrawlState(f"{keyword} (pushed since {since.strftime(SEARCH_DATE_FORMAT)})")
+    changed = await search_github_repositories(keyword=keyword, session=session, with_latest_commit=True, state=state, start_date=since)
+    # The end date planned for the search, recorded by the state
+    searched_until = state.get_end_date(datetime.now(timezone.utc).replace(microsecond=0))
+    state.close()
+
+    repositories = {repository["id"]: repository for repository in snapshot}
+    changes = []
+    unresolved = []
+    for repository in changed:
+        previous = repositories.get(repository["id"])
+        if previous is not None and previous["pushedAt"] == repository["pushedAt"]:
+            # Nothing was pushed, the sha of the snapshot is still the latest one
+            for field in ("latest_commit", "link_to_latest_commit"):
+                if field in previous:
+                    repository[field] = previous[field]
+        elif "latest_commit" not in repository:
+            unresolved.append(repository)
+        if previous is None:
+            changes.append({"id": repository["id"], "url": repository["url"], "change": "added"})
+        elif previous != repository:
+            changes.append({"id": repository["id"], "url": repository["url"], "change": "updated"})
+        repositories[repository["id"]] = repository
+
+    if unresolved:
+        await get_latest_hashes(unresolved, session=session)
+
+    if check_deleted:
+        changed_ids = {repository["id"] for repository in changed}
+        others = [repository_id for repository_id in repositories if repository_id not in changed_ids]
+        existing, not_found = await get_existing_nodes(others, session)
+        searched_from = since.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        searched_to = searched_until.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        unknown = 0
+        for repository_id in others:
+            pushed_at = existing.get(repository_id)
+            if repository_id in not_found:
+                repository = repositories.pop(repository_id)
+                changes.append({"id": repository_id, "url": repository["url"], "change": "deleted", "reason": "NOT_FOUND"})
+            elif pushed_at is None:
+                # Neither found nor reported missing, e.g. not accessible: kept as it was
+                unknown += 1
+            elif searched_from < pushed_at <= searched_to:
+                # Pushed within the searched period but not found by the search: kept, as the
+                # search may have missed it
+                changes.append({"id": repository_id, "url": repositories[repository_id]["url"], "change": "unmatched"})
+        if unknown:
+            print(f"Warning: {unknown} repositories could not be looked up and are kept unchanged")
+
+    counts = {change: sum(1 for entry in changes if entry["change"] == change) for change in ("added", "updated", "deleted", "unmatched")}
+    print(f"{counts['added']} added, {counts['updated']} updated and {counts['deleted']} deleted repositories, {counts['unmatched']} unmatched")
+    return list(repositories.values()), changes, searched_until
+
+
+async def incremental_crawl(keyword: str, session: GitHubSession, directory: str = "out") -> tuple[list, list] | None:
+    """Updates the latest snapshot of the directory and writes the new snapshot and its change log.
+
+    Returns None when there is no previous snapshot to update.
+    """
+    path = find_latest_snapshot(directory)
+    if path is None:
+        return None
+
+    print(f"Updating the snapshot {path}")
+    with open(path, encoding="utf-8") as file:
+        snapshot = json.load(file)
+    since = get_searched_until(path) - SNAPSHOT_OVERLAP
+
+    repositories, changes, searched_until = await update_snapshot(keyword, snapshot, since, session)
+
+    now = write_snapshot(repositories, searched_until, directory)
+    with open(os.path.join(directory, f"digital_twin_repos_github_changes_{now}.json"), "w", encoding="utf-8") as file:
+        json.dump({"previous_snapshot": os.path.basename(path), "changes": changes}, file, indent=4)
+    return repositories, changes
@@ -0,0 +1,102 @@
+from keyword_queries import normalize_text, SEARCH_RESULTS_LIMIT
+
+
+def stem(word: str) -> str:
+    """Strips the common English inflections, e.g. "twins" and "modeling" become "twin" and "model"."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("sses"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    if len(word) > 5 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 4 and word.endswith("ed") and not word.endswith("eed"):
+        return word[:-2]
+    return word
+
+
+def get_terms(keyword: str) -> tuple[str, ...]:
+    """The stemmed words of a keyword, in their order."""
+    return tuple(stem(word) for word in normalize_text(keyword).split())
+
+
+def get_key(terms: tuple[str, ...]) -> str:
+    """The terms joined without separators, so that "Cyber-Physical Systems" and "cyberphysical system" are alike."""
+    return "".join(terms)
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parents = list(range(size))
+
+    def find(self, item: int) -> int:
+        while self.parents[item] != item:
+            self.parents[item] = self.parents[self.parents[item]]
+            item = self.parents[item]
+        return item
+
+    def union(self, first: int, second: int) -> None:
+        self.parents[self.find(second)] = self.find(first)
+
+
+def cluster_keywords(keywords: list[str], counts: dict[str, int] | None = None, max_results: int = SEARCH_RESULTS_LIMIT) -> dict[str, list[str]]:
+    """Groups the keywords that search for the same repositories, by representative keyword.
+
+    Keywords are only grouped when they are the same phrase up to case, separators and
+    plurals: their stemmed words, in order and joined without separators, are the same
+    ("digital twin", "Digital Twins", "digital-twin"). Keywords with the same words in
+    another order ("data model" and "model data") or merely similar spellings ("digital
+    thread" and "digital threat") are different phrases and are kept apart. The
+    representative of a cluster is its most general keyword, the one with the fewest
+    words, then the shortest.
+
+    Given the number of repositories of each keyword, a keyword also covers the keywords
+    containing it as a phrase ("digital twin framework" only finds repositories that
+    "digital twin" finds), but only when it matches at most max_results repositories: a
+    search does not return the results beyond, so a more general keyword over the limit
+    would lose the results of the specific ones. Without counts, there is no containment.
+    """
+    keywords = list(dict.fromkeys(keyword.strip() for keyword in keywords if keyword.strip()))
+    terms = [get_terms(keyword) for keyword in keywords]
+    clusters = UnionFind(len(keywords))
+
+    # Same phrase, then containment: a keyword is covered by a more general keyword found
+    # in its words and whose results can all be fetched. Keywords have a few words, so
+    # their sub-phrases are looked up directly.
+    by_key: dict[str, int] = {}
+    for index in sorted(range(len(keywords)), key=lambda i: len(terms[i])):
+        key = get_key(terms[index])
+        if key in by_key:
+            clusters.union(by_key[key], index)
+            continue
+        by_key[key] = index
+        if counts is None:
+            continue
+        length = len(terms[index])
+        sub_phrases = (
+            get_key(terms[index][start:start + size])
+            for size in range(1, length)
+            for start in range(length - size + 1)
+        )
+        general = next((
+            by_key[sub_phrase] for sub_phrase in sub_phrases
+            if sub_phrase in by_key and counts.get(keywords[by_key[sub_phrase]], max_results + 1) <= max_results
+        ), None)
+        if general is not None:
+            clusters.union(general, index)
+
+    members: dict[int, list[int]] = {}
+    for index in range(len(keywords)):
+        members.setdefault(clusters.find(index), []).append(index)
+    result = {}
+    for indexes in members.values():
+        representative = min(indexes, key=lambda i: (len(terms[i]), len(keywords[i]), i))
+        result[keywords[representative]] = [keywords[i] for i in indexes]
+    return result
+
+
+def collapse_keywords(keywords: list[str], counts: dict[str, int] | None = None, max_results: int = SEARCH_RESULTS_LIMIT) -> list[str]:
+    """The representative keyword of each cluster of duplicates, in the order of the keywords."""
+    representatives = set(cluster_keywords(keywords, counts, max_results))
+    return [keyword for keyword in dict.fromkeys(keyword.strip() for keyword in keywords) if keyword in representatives]
@@ -0,0 +1,136 @@
+import asyncio
+import os
+import sqlite3
+
+import pandas as pd
+
+from keyword_maker import create_prompts, generate_keywords_async, OLLAMA_CONCURRENCY
+from llm_cache import LlmCache
+
+KEYWORD_STORE_PATH = "out/keywords.sqlite"
+# Keywords further than this number of expansions from their seed are not expanded
+EXPANSION_MAX_DEPTH = 3
+# Maximum number of prompts sent by an expansion
+EXPANSION_BUDGET = 500
+
+
+class KeywordStore:
+    """Keywords, the seed and parent keyword that produced each of them, and whether they were expanded.
+
+    A keyword is stored once, lowercased, with its first provenance: seeds have no parent
+    and a depth of 0, the keywords generated from a keyword of depth n have a depth of n + 1.
+    """
+
+    def __init__(self, path: str = KEYWORD_STORE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS keywords (
+                id INTEGER PRIMARY KEY,
+                keyword TEXT NOT NULL UNIQUE,
+                seed INTEGER,
+                parent INTEGER,
+                depth INTEGER NOT NULL,
+                expanded INTEGER NOT NULL DEFAULT 0
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS keywords_frontier ON keywords (expanded, depth)")
+        self.connection.commit()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM keywords").fetchone()[0]
+
+    def add_seeds(self, keywords: list[str]) -> int:
+        """Adds seed keywords and returns the number of new ones."""
+        before = len(self)
+        for keyword in keywords:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO keywords (keyword, depth) VALUES (?, 0)", (keyword.strip().lower(),)
+            )
+            if cursor.lastrowid and cursor.rowcount:
+                self.connection.execute("UPDATE keywords SET seed = id WHERE id = ?", (cursor.lastrowid,))
+        self.connection.commit()
+        return len(self) - before
+
+    def add_children(self, parent: str, keywords: list[str]) -> int:
+        """Adds the keywords generated from a parent keyword and returns the number of new ones."""
+        row = self.connection.execute("SELECT id, seed, depth FROM keywords WHERE keyword = ?", (parent,)).fetchone()
+        if row is None:
+            raise KeyError(parent)
+        parent_id, seed, depth = row
+        before = len(self)
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO keywords (keyword, seed, parent, depth) VALUES (?, ?, ?, ?)",
+            [(keyword.strip().lower(), seed, parent_id, depth + 1) for keyword in keywords if keyword.strip()],
+        )
+        self.connection.execute("UPDATE keywords SET expanded = 1 WHERE id = ?", (parent_id,))
+        self.connection.commit()
+        return len(self) - before
+
+    def get_frontier(self, max_depth: int = EXPANSION_MAX_DEPTH) -> list[str]:
+        """The keywords not expanded yet, closest to their seed first."""
+        rows = self.connection.execute(
+            "SELECT keyword FROM keywords WHERE expanded = 0 AND depth < ? ORDER BY depth, id", (max_depth,)
+        )
+        return [keyword for (keyword,) in rows]
+
+    def get_keywords(self) -> list[str]:
+        return [keyword for (keyword,) in self.connection.execute("SELECT keyword FROM keywords ORDER BY id")]
+
+    def get_provenance(self, keyword: str) -> list[str]:
+        """The chain of keywords from the seed to the given keyword."""
+        chain = []
+        row = self.connection.execute("SELECT keyword, parent FROM keywords WHERE keyword = ?", (keyword.strip().lower(),)).fetchone()
+        while row is not None:
+            chain.append(row[0])
+            row = self.connection.execute("SELECT keyword, parent FROM keywords WHERE id = ?", (row[1],)).fetchone() if row[1] else None
+        return chain[::-1]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.read_sql_query("""
+            SELECT keyword.keyword AS Keywords, seed.keyword AS Seed, parent.keyword AS Parent, keyword.depth AS Depth
+            FROM keywords AS keyword
+            LEFT JOIN keywords AS seed ON seed.id = keyword.seed
+            LEFT JOIN keywords AS parent ON parent.id = keyword.parent
+            ORDER BY keyword.id""", self.connection)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def expand_keywords(store: KeywordStore, meta_prompt: str, model_name: str = "deepseek-r1:8b", max_depth: int = EXPANSION_MAX_DEPTH, budget: int = EXPANSION_BUDGET, concurrency: int = OLLAMA_CONCURRENCY, cache: LlmCache | None = None) -> int:
+    """Expands the keywords of the store round by round until no keyword is left to expand.
+
+    Each round only prompts the frontier, the keywords not expanded yet, so the keywords
+    expanded by earlier rounds or runs are never prompted again. The expansion stops at the
+    fixpoint, when a round adds no new keyword to expand, or once budget prompts were sent.
+    A keyword is only marked expanded once the model answered its prompt: the keywords
+    whose prompt failed (timeout, Ollama error or unparseable response) are not prompted
+    again in this run but stay in the frontier, like the ones of an interrupted expansion,
+    for the next run. Returns the number of prompts sent.
+    """
+    prompts_sent = 0
+    round_number = 0
+    failed: set[str] = set()
+    while prompts_sent < budget:
+        frontier = [keyword for keyword in store.get_frontier(max_depth) if keyword not in failed][:budget - prompts_sent]
+        if not frontier:
+            break
+        round_number += 1
+        print(f"Expansion round {round_number}: {len(frontier)} keywords to expand")
+
+        results = asyncio.run(generate_keywords_async(create_prompts(frontier), meta_prompt, model_name, concurrency=concurrency, cache=cache))
+        prompts_sent += len(frontier)
+        added = 0
+        for keyword, keywords in zip(frontier, results):
+            if keywords is None:
+                failed.add(keyword)
+            else:
+                added += store.add_children(keyword, keywords)
+        print(f"Expansion round {round_number}: {added} new keywords")
+
+    if failed:
+        print(f"{len(failed)} keywords could not be expanded and are left for the next run")
+    if prompts_sent >= budget and store.get_frontier(max_depth):
+        print(f"Expansion budget of {budget} prompts used, {len(store.get_frontier(max_depth))} keywords left to expand")
+    return prompts_sent
@@ -1,8 +1,18 @@
+import httpx
 import ollama
 import re
+import sys
 import json
+import asyncio
 import pandas as pd
 
+from llm_cache import LlmCache
+
+# Number of prompts sent to the Ollama server at the same time, see OLLAMA_NUM_PARALLEL
+OLLAMA_CONCURRENCY = 4
+# Number of seconds after which a prompt is given up
+OLLAMA_TIMEOUT = 300
+
 def create_prompt(keyword: str) -> str:
     """Create a prompt based on a keyword."""
     return f"Give keywords relative to the word:\n{keyword}"
@@ -13,15 +23,21 @@ def create_prompts(keywords: list[str]) -> list[str]:
     return [create_prompt(keyword) for keyword in keywords]
 
 
+def clean_response(content: str) -> str:
+    """Removes the <think>...</think> block of a reasoning model."""
+    return re.sub(r"<think>.*?</think>", "", content, flags=re.DOTALL).strip()
+
+
 def ask_ollama(model_name: str, messages: list[dict[str, str]]) -> str:
     """Asks Ollama for a given prompt using a given model."""
     response = ollama.chat(model=model_name, messages=messages)
-    content = response['message']['content']
+    return clean_response(response['message']['content'])
 
-    # Remove <think>...</think> block
-    content = re.sub(r"<think>.*?</think>", "", content, flags=re.DOTALL).strip()
 
-    return content
+async def ask_ollama_async(client: ollama.AsyncClient, model_name: str, messages: list[dict[str, str]], timeout: float = OLLAMA_TIMEOUT) -> str:
+    """Asks Ollama for a given prompt using a given model, without blocking the event loop."""
+    response = await asyncio.wait_for(client.chat(model=model_name, messages=messages), timeout)
+    return clean_response(response['message']['content'])
 
 
 def get_keywords(response: str) -> list[str]:
@@ -41,20 +57,73 @@ def get_keywords(response: str) -> list[str]:
     return []
 
 
-def generate_keywords(prompts: list[str], meta_prompt: str, model_name: str = "deepseek-r1:8b") -> list[str]:
-    """This generates keywords based on a list of prompts."""
+def generate_keywords(prompts: list[str], meta_prompt: str, model_name: str = "deepseek-r1:8b", cache: LlmCache | None = None) -> list[str]:
+    """This generates keywords based on a list of prompts, the ones in the cache being answered from it."""
     results = []
     for prompt in prompts:
         print(prompt)
+        cached = cache.get(model_name, meta_prompt, prompt) if cache is not None else None
+        if cached is not None:
+            results += cached[1]
+            continue
         messages = [
             {"role": "system", "content": meta_prompt},
             {"role": "user", "content": prompt}
         ]
         response = ask_ollama(model_name=model_name, messages=messages)
-        results += get_keywords(response)
+        keywords = get_keywords(response)
+        if cache is not None:
+            cache.put(model_name, meta_prompt, prompt, response, keywords)
+        results += keywords
     return results
 
 
+async def generate_keywords_async(prompts: list[str], meta_prompt: str, model_name: str = "deepseek-r1:8b", concurrency: int = OLLAMA_CONCURRENCY, timeout: float = OLLAMA_TIMEOUT, host: str | None = None, cache: LlmCache | None = None) -> list[list[str] | None]:
+    """Generates the keywords of many prompts, up to concurrency prompts at the same time.
+
+    The server only answers that many prompts in parallel if its OLLAMA_NUM_PARALLEL
+    setting allows it. Returns the keywords of each prompt, in the order of the prompts; a
+    prompt that times out, fails or whose response cannot be parsed gets None, so that it
+    is not mistaken for a prompt the model answered with no keywords. Prompts
+    found in the cache are answered from it, and the new responses are added to it.
+    """
+    client = ollama.AsyncClient(host=host)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def generate(prompt: str) -> list[str] | None:
+        cached = cache.get(model_name, meta_prompt, prompt) if cache is not None else None
+        if cached is not None:
+            return cached[1]
+        messages = [
+            {"role": "system", "content": meta_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        async with semaphore:
+            print(prompt)
+            try:
+                response = await ask_ollama_async(client, model_name=model_name, messages=messages, timeout=timeout)
+            except (asyncio.TimeoutError, ollama.ResponseError, ConnectionError, httpx.HTTPError) as error:
+                # ollama only wraps some of the httpx errors, e.g. not a dropped connection
+                print(f"Error for the prompt {prompt!r}: {type(error).__name__} {error}")
+                return None
+        try:
+            keywords = get_keywords(response)
+        except ValueError:
+            print(f"Error: badly formatted response for the prompt {prompt!r}")
+            return None
+        if cache is not None:
+            cache.put(model_name, meta_prompt, prompt, response, keywords)
+        return keywords
+
+    return await asyncio.gather(*(generate(prompt) for prompt in prompts))
+
+
+def generate_keywords_concurrently(prompts: list[str], meta_prompt: str, model_name: str = "deepseek-r1:8b", concurrency: int = OLLAMA_CONCURRENCY, timeout: float = OLLAMA_TIMEOUT, host: str | None = None, cache: LlmCache | None = None) -> list[str]:
+    """Like generate_keywords, with up to concurrency prompts sent at the same time (see generate_keywords_async)."""
+    results = asyncio.run(generate_keywords_async(prompts, meta_prompt, model_name, concurrency, timeout, host, cache))
+    return [keyword for keywords in results if keywords for keyword in keywords]
+
+
 def create_dataframe(keywords: list[str]) -> pd.DataFrame:
     """Create a single column DataFrame based on a list of keywords. Duplicates are removed."""
     # Create a DataFrame with a single column
@@ -73,23 +142,26 @@ def save_dataframe(dataframe: pd.DataFrame, path: str = "out/example.csv") -> No
     dataframe.to_csv(path, index=False)
 
 
-input_keywords = [
-    "digital twins",
-    "Virtual Representation",
-    "Cyber-Physical System",
-    "Simulation Model",
-    "Data Synchronization",
-    "Real-Time Monitoring",
-    "System Simulation",
-    "Virtual Prototyping",
-    "Internet of Things",
-    "ISO 23247", # Digital Twin Framework Norm
-    "Digital Twin Framework"
-]
-meta_prompt = "I'm working on a project where I need keywords that refer to digital twins. You give each keyword separately in a json format. Like this:\n ```json\n{ \n\"keywords\": [\n    \"digital twin\",\n    \"digital model\"\n  ]}\n```\n Give the maximum keywords possible. Give solely the json text code."
-prompts = create_prompts(input_keywords)
-model_name = "deepseek-r1:8b"
-
-results = generate_keywords(prompts=prompts, meta_prompt=meta_prompt, model_name=model_name)
-results_df = create_dataframe(results)
-save_dataframe(results_df, "out/start_keywords2.csv")
+if __name__ == "__main__":
+    # The prompts already answered are read from the cache, unless --no-cache is given
+    cache = None if "--no-cache" in sys.argv[1:] else LlmCache()
+    input_keywords = [
+        "digital twins",
+        "Virtual Representation",
+        "Cyber-Physical System",
+        "Simulation Model",
+        "Data Synchronization",
+        "Real-Time Monitoring",
+        "System Simulation",
+        "Virtual Prototyping",
+        "Internet of Things",
+        "ISO 23247", # Digital Twin Framework Norm
+        "Digital Twin Framework"
+    ]
+    meta_prompt = "I'm working on a project where I need keywords that refer to digital twins. You give each keyword separately in a json format. Like this:\n ```json\n{ \n\"keywords\": [\n    \"digital twin\",\n    \"digital model\"\n  ]}\n```\n Give the maximum keywords possible. Give solely the json text code."
+    prompts = create_prompts(input_keywords)
+    model_name = "deepseek-r1:8b"
+
+    results = generate_keywords_concurrently(prompts=prompts, meta_prompt=meta_prompt, model_name=model_name, cache=cache)
+    results_df = create_dataframe(results)
+    save_dataframe(results_df, "out/start_keywords2.csv")
@@ -0,0 +1,100 @@
+import math
+
+from typing import NamedTuple
+from gql import GraphQLRequest
+from gql.transport.exceptions import TransportQueryError, TransportServerError
+from github_session import GitHubSession, RATE_LIMIT_FIELD
+from keyword_queries import SEARCH_RESULTS_LIMIT, build_query, normalize_text
+from repository_store import as_keyword_list
+
+# Number of aliased search counts requested by a single GraphQL request
+KEYWORD_COUNT_BATCH_SIZE = 25
+# Keywords whose results are at least this much already collected are not searched
+COVERAGE_THRESHOLD = 0.9
+
+
+class KeywordPlan(NamedTuple):
+    """The expected yield of a keyword: its number of repositories, how many are already collected, and the pages to fetch."""
+    keyword: str
+    count: int
+    covered: int
+    expected_new: int
+    pages: int
+
+
+async def get_keyword_counts(keywords: list[str], session: GitHubSession, batch_size: int = KEYWORD_COUNT_BATCH_SIZE, quoted: bool = True) -> dict[str, int]:
+    """Gets the repositoryCount of many keywords, batch_size aliased searches per GraphQL request.
+
+    Like get_repository_count, but a single request counts a whole batch of keywords. Each
+    keyword is counted with the query it is searched with: the phrase built by
+    keyword_queries.build_query when quoted, the keyword as it is otherwise. The keywords
+    of a batch that failed are left out of the counts, their count being unknown.
+    """
+    counts = {}
+    for start in range(0, len(keywords), batch_size):
+        batch = keywords[start:start + batch_size]
+        print(f"Counting the repositories of keywords {start}-{start + len(batch)}/{len(keywords)}")
+        variables = ", ".join(f"$query{i}: String!" for i in range(len(batch)))
+        aliases = "\n".join(
+            f"keyword{i}: search(type:REPOSITORY, query:$query{i}) {{ repositoryCount }}" for i in range(len(batch))
+        )
+        request = GraphQLRequest(
+            f"query getKeywordCounts ({variables}) {{\n{aliases}\n{RATE_LIMIT_FIELD}\n}}",
+            variable_values={f"query{i}": build_query([keyword]) if quoted else keyword for i, keyword in enumerate(batch)},
+        )
+        try:
+            result = await session.execute(request)
+        except (TransportQueryError, TransportServerError) as error:
+            print(f"Error: unable to count the repositories of keywords {start}-{start + len(batch)}: {error}")
+            result = getattr(error, "data", None) or {}
+        for i, keyword in enumerate(batch):
+            if result.get(f"keyword{i}"):
+                counts[keyword] = result[f"keyword{i}"]["repositoryCount"]
+    return counts
+
+
+def estimate_coverage(keywords: list[str], repositories: list[dict]) -> dict[str, int]:
+    """Estimates how many repositories of each keyword were already collected.
+
+    A collected repository counts for a keyword when the keyword already found it, or when
+    the keyword is in its name or description, which is where the search would match it.
+    """
+    texts = [
+        " " + normalize_text(f"{repository.get('name') or ''} {repository.get('description') or ''}") + " "
+        for repository in repositories
+    ]
+    found_by = {}
+    for repository in repositories:
+        for keyword in as_keyword_list(repository.get("search_keyword")):
+            found_by[keyword] = found_by.get(keyword, 0) + 1
+
+    coverage = {}
+    for keyword in keywords:
+        phrase = " " + normalize_text(keyword) + " "
+        matched = sum(1 for text in texts if phrase in text)
+        coverage[keyword] = max(matched, found_by.get(keyword, 0))
+    return coverage
+
+
+def plan_keyword_searches(counts: dict[str, int], coverage: dict[str, int] | None = None, per_page: int = 10, max_pages: int = 100, coverage_threshold: float = COVERAGE_THRESHOLD) -> list[KeywordPlan]:
+    """Orders the keywords by expected number of new repositories and gives each the pages it needs.
+
+    A search returns at most 1000 repositories, so a keyword cannot yield more, whatever
+    its count. Keywords matching nothing, or whose repositories are mostly collected already
+    (coverage_threshold), are left out.
+    """
+    plans = []
+    for keyword, count in counts.items():
+        covered = min((coverage or {}).get(keyword, 0), count)
+        if count == 0 or covered >= coverage_threshold * count:
+            continue
+        reachable = min(count, SEARCH_RESULTS_LIMIT)
+        # The collected repositories are assumed to be spread evenly in the results
+        expected_new = round(reachable * (1 - covered / count))
+        pages = min(max_pages, math.ceil(reachable / per_page))
+        plans.append(KeywordPlan(keyword, count, covered, expected_new, pages))
+    plans.sort(key=lambda plan: plan.expected_new, reverse=True)
+
+    skipped = len(counts) - len(plans)
+    print(f"{len(plans)} keywords to search, {sum(plan.pages for plan in plans)} pages; {skipped} keywords skipped (no results or already covered)")
+    return plans
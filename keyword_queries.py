@@ -0,0 +1,69 @@
+import re
+
+# GitHub rejects search queries longer than 256 characters or with more than five
+# AND, OR or NOT operators
+SEARCH_QUERY_MAX_LENGTH = 256
+SEARCH_QUERY_MAX_OPERATORS = 5
+# A search, whatever its number of pages, does not return more than 1000 results
+SEARCH_RESULTS_LIMIT = 1000
+
+
+def quote_keyword(keyword: str) -> str:
+    """Quotes a keyword so that its words are searched as a phrase."""
+    return '"' + keyword.replace('"', "").strip() + '"'
+
+
+def build_query(keywords: list[str]) -> str:
+    """Builds the search query matching any of the given keywords."""
+    return " OR ".join(quote_keyword(keyword) for keyword in keywords)
+
+
+def pack_keywords(keywords: list[str], counts: dict[str, int] | None = None, max_length: int = SEARCH_QUERY_MAX_LENGTH, max_operators: int = SEARCH_QUERY_MAX_OPERATORS, max_results: int = SEARCH_RESULTS_LIMIT) -> list[list[str]]:
+    """Packs keywords into as few OR-queries as GitHub allows, in their original order.
+
+    The keywords of a query share its max_results results, so they are only packed given
+    the number of repositories of each keyword, and a query is closed before its keywords
+    can match more than max_results repositories. A query also holds at most
+    max_operators + 1 keywords and max_length characters. A keyword whose count is
+    unknown, or that is too long or too frequent for any query, is searched alone.
+    """
+    groups = []
+    group = []
+    total = 0
+    for keyword in dict.fromkeys(keyword.strip() for keyword in keywords if keyword.strip()):
+        count = (counts or {}).get(keyword)
+        if count is None:
+            groups.extend([group, [keyword]] if group else [[keyword]])
+            group = []
+            total = 0
+            continue
+        if group and (
+            len(group) > max_operators
+            or len(build_query(group + [keyword])) > max_length
+            or total + count > max_results
+        ):
+            groups.append(group)
+            group = []
+            total = 0
+        group.append(keyword)
+        total += count
+    if group:
+        groups.append(group)
+    return groups
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases a text and replaces its punctuation by spaces, e.g. "Digital-Twin" becomes "digital twin"."""
+    return " ".join(re.sub(r"[\W_]+", " ", text.lower()).split())
+
+
+def match_keywords(repository: dict, keywords: list[str]) -> list[str]:
+    """The keywords found in the name, description or topics of a search result (REST item).
+
+    GitHub also matches keywords in the README, which is not part of the result. A result
+    matched by none of the keywords of its query is therefore credited to all of them.
+    """
+    fields = [repository.get("name") or "", repository.get("description") or "", *(repository.get("topics") or [])]
+    text = " " + " ".join(normalize_text(field) for field in fields) + " "
+    matched = [keyword for keyword in keywords if " " + normalize_text(keyword) + " " in text]
+    return matched or list(keywords)
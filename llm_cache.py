@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+LLM_CACHE_PATH = "out/llm_cache.sqlite"
+# The least recently used responses are evicted above this size (in bytes)
+LLM_CACHE_MAX_SIZE = 64 * 1024 * 1024
+
+
+class LlmCache:
+    """Persistent cache of LLM responses, addressed by the model, system prompt and user prompt.
+
+    The raw response is stored along with the keywords parsed from it, so a prompt already
+    answered by the same model with the same system prompt comes back without any
+    inference. The least recently used responses are evicted above max_size bytes.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_size: int = LLM_CACHE_MAX_SIZE):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                keywords TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.lock = threading.Lock()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def key(self, model_name: str, system_prompt: str, prompt: str) -> str:
+        return hashlib.sha256(json.dumps([model_name, system_prompt, prompt]).encode()).hexdigest()
+
+    def get(self, model_name: str, system_prompt: str, prompt: str) -> tuple[str, list[str]] | None:
+        """The response and keywords of a prompt, None if it was not answered yet."""
+        key = self.key(model_name, system_prompt, prompt)
+        with self.lock:
+            row = self.connection.execute("SELECT response, keywords FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+        return row[0], json.loads(row[1])
+
+    def put(self, model_name: str, system_prompt: str, prompt: str, response: str, keywords: list[str]) -> None:
+        key = self.key(model_name, system_prompt, prompt)
+        keywords = json.dumps(keywords)
+        size = len(response.encode()) + len(keywords.encode())
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if previous:
+                self.total_size -= previous[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, response, keywords, size, time.time()),
+            )
+            self.connection.commit()
+            self.total_size += size
+        if self.total_size > self.max_size:
+            self.evict()
+
+    def evict(self) -> None:
+        """Removes the least recently used responses above max_size."""
+        with self.lock:
+            rows = self.connection.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+            evicted = []
+            for key, size in rows:
+                if self.total_size <= self.max_size:
+                    break
+                evicted.append((key,))
+                self.total_size -= size
+            self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": self.total_size}
+
+    def close(self) -> None:
+        self.connection.close()
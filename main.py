@@ -1,27 +1,61 @@
 import asyncio
-import json
+import sys
 
-from datetime import datetime
-from github_scraper import get_github_token, search_github_repositories, get_latest_hash
+from datetime import datetime, timezone
+from github_scraper import search_github_repositories, get_latest_hashes
+from github_session import GitHubSession
+from token_pool import TokenPool, get_github_tokens
+from http_cache import HttpCache
+from crawl_state import CrawlState
+from incremental_crawl import incremental_crawl, write_snapshot
+from pipeline import run_pipeline
+from repository import Repository
+from repository_dataset import write_dataset
 
 async def main():
     keyword = "digital twin"
-    github_token = get_github_token()
-    repos = await search_github_repositories(keyword=keyword, github_token=github_token)
+    # The latest snapshot is updated with the repositories pushed since, unless --full is given
+    full_crawl = "--full" in sys.argv[1:]
+    # With --stream, the repositories are enriched and written to a NDJSON file while the search goes on
+    stream = "--stream" in sys.argv[1:]
+    tokens = TokenPool(get_github_tokens())
+    http_cache = HttpCache()
 
-    n = len(repos)
-    for i, repository in enumerate(repos):
-        print(f"Getting sha for repository {i}/{n}")
-        owner = repository["owner"]["login"]
-        repo_name = repository["name"]
-        sha = get_latest_hash(owner=owner, repo_name=repo_name, github_token=github_token)
+    # A single pool of kept-alive connections is shared by the whole crawl
+    async with GitHubSession(tokens, cache=http_cache) as session:
+        if stream:
+            await run_pipeline(keyword, session)
+            repos = None
+            snapshot = None
+        elif not full_crawl and (updated := await incremental_crawl(keyword, session)) is not None:
+            # The new snapshot was written by incremental_crawl
+            repos = None
+            snapshot = updated[0]
+        else:
+            # An interrupted crawl of the keyword is resumed where it stopped
+            state = CrawlState(keyword)
+            repos = await search_github_repositories(keyword=keyword, session=session, with_latest_commit=True, state=state)
+            # The search covered the pushes until its planning, the next update starts from there
+            searched_until = state.get_end_date(datetime.now(timezone.utc).replace(microsecond=0))
 
-        repository["latest_commit"] = sha
-        repository["link_to_latest_commit"] = f"https://github.com/{owner}/{repo_name}/tree/{sha}"
+            # Repositories without a default branch in the search results are resolved in batches
+            unresolved = [repository for repository in repos if "latest_commit" not in repository]
+            print(f"{len(repos) - len(unresolved)}/{len(repos)} shas resolved by the search query")
+            if unresolved:
+                await get_latest_hashes(unresolved, session=session)
+            snapshot = repos
+
+    for token_stats in tokens.stats():
+        print(token_stats)
+    print(http_cache.stats())
+
+    if repos is not None:
+        write_snapshot(repos, searched_until)
+
+    if snapshot is not None:
+        # Columnar copy of the snapshot for the analysis, see repository_dataset.load_dataset
+        write_dataset(Repository.from_graphql_node(repository) for repository in snapshot)
 
-    with open(f"out/digital_twin_repos_github_with_sha_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json", 'w', encoding='utf-8') as file:
-        json.dump(repos, file, indent=4)
 
-    
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
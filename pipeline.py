@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+from datetime import datetime
+from github_scraper import iter_search_pages, get_latest_hashes, SEARCH_CONCURRENCY, SEARCH_START_DATE
+from github_session import GitHubSession
+from repository_counts import count_items_async, get_commit_counts
+
+# Number of pages enriched at the same time
+ENRICHMENT_WORKERS = 4
+# Number of pages waiting between two stages
+STAGE_QUEUE_SIZE = 8
+
+
+async def enrich_page(page: list, session: GitHubSession, with_counts: bool = True) -> list:
+    """Adds the latest commit sha and, with_counts, the numbers of commits and contributors to a page."""
+    unresolved = [repository for repository in page if "latest_commit" not in repository]
+    if unresolved:
+        await get_latest_hashes(unresolved, session=session)
+
+    if with_counts:
+        pairs = [(repository["owner"]["login"], repository["name"]) for repository in page]
+        commit_counts = await get_commit_counts(pairs, session)
+        contributor_counts = await asyncio.gather(*(
+            count_items_async(session, f"/repos/{owner}/{name}/contributors") for owner, name in pairs
+        ))
+        for repository, commits, contributors in zip(page, commit_counts, contributor_counts):
+            repository["commits"] = commits
+            repository["contributors"] = contributors
+    return page
+
+
+def append_ndjson(path: str, repositories: list) -> None:
+    """Appends repositories to a line-delimited JSON file, one repository per line."""
+    with open(path, "a", encoding="utf-8") as file:
+        for repository in repositories:
+            file.write(json.dumps(repository) + "\n")
+
+
+async def run_pipeline(keyword: str, session: GitHubSession, path: str | None = None, with_counts: bool = True, search_concurrency: int = SEARCH_CONCURRENCY, enrichment_workers: int = ENRICHMENT_WORKERS, queue_size: int = STAGE_QUEUE_SIZE, start_date: datetime = SEARCH_START_DATE) -> int:
+    """Streams the repositories of a search through the enrichment stage to a NDJSON file.
+
+    The search pages flow to the enrichment workers while the next ones are fetched, and
+    each enriched page is appended to the file. The stages are connected by bounded
+    queues, so a slow stage makes the previous one wait and the memory used does not grow
+    with the number of repositories. Returns the number of repositories written.
+    """
+    if path is None:
+        path = f"out/digital_twin_repos_github_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson"
+    print(f"Streaming the repositories to {path}")
+
+    pages: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    enriched: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def search() -> None:
+        try:
+            async for _, _, page in iter_search_pages(keyword, session, with_latest_commit=True, concurrency=search_concurrency, start_date=start_date, queue_size=queue_size):
+                await pages.put(page)
+        finally:
+            for _ in range(enrichment_workers):
+                await pages.put(None)
+
+    async def enrich() -> None:
+        while (page := await pages.get()) is not None:
+            await enriched.put(await enrich_page(page, session, with_counts))
+
+    async def enrich_all() -> None:
+        try:
+            await asyncio.gather(*(enrich() for _ in range(enrichment_workers)))
+        finally:
+            await enriched.put(None)
+
+    tasks = [asyncio.create_task(search()), asyncio.create_task(enrich_all())]
+    written = 0
+    try:
+        while (page := await enriched.get()) is not None:
+            append_ndjson(path, page)
+            written += len(page)
+        # Raises the error of a stage, if any
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    print(f"{written} repositories written to {path}")
+    return written
@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+
+from datetime import datetime
+
+# Requests allowed by GitHub to an authenticated user: (limit, window in seconds)
+GITHUB_RATE_LIMITS = {
+    "core": (5000, 3600),
+    "search": (30, 60),
+    "graphql": (5000, 3600),
+}
+# Number of requests that can be sent back to back before being paced
+DEFAULT_BURST = 100
+
+
+class Quota:
+    """Quota of a single resource, as reported by the API, with a token bucket used until it is known."""
+
+    def __init__(self, limit: int, window: float, burst: int):
+        self.limit = limit
+        self.rate = limit / window
+        self.capacity = max(1, min(burst, limit))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        # Last quota reported by the API, None until a response was received
+        self.remaining: int | None = None
+        self.reset: float | None = None
+        self.blocked_until = 0.0
+        # Earliest time of the next request while the last requests of the window are spread out
+        self.next_request = 0.0
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+def to_monotonic(timestamp: float) -> float:
+    """Converts an epoch timestamp sent by the API to the monotonic clock used for pacing."""
+    return time.monotonic() + timestamp - time.time()
+
+
+def is_rate_limited(status: int, headers) -> bool:
+    """Tells if a response was rejected because the quota or a secondary limit was reached."""
+    if status not in (403, 429):
+        return False
+    headers = {key.lower(): value for key, value in headers.items()}
+    return headers.get("x-ratelimit-remaining") == "0" or "retry-after" in headers
+
+
+def get_rate_limit_delay(headers, default: float = 60) -> float:
+    """Number of seconds to wait after a rate-limited response, from its Retry-After or X-RateLimit-Reset header."""
+    headers = {key.lower(): value for key, value in headers.items()}
+    if "retry-after" in headers:
+        return float(headers["retry-after"])
+    if "x-ratelimit-reset" in headers:
+        return max(float(headers["x-ratelimit-reset"]) - time.time(), 0.0) + 1
+    return default
+
+
+class RateLimitScheduler:
+    """Paces the requests of every scraper sharing it, per API resource.
+
+    The quota reported by the responses (X-RateLimit-* headers or the GraphQL rateLimit
+    field) is tracked: requests are sent right away while it is plentiful, the last
+    requests of a window are spread out until its reset, and once it is used up every
+    caller sleeps until the reset time. Until a quota is reported, callers are paced with
+    a token bucket refilled at the rate documented by the API.
+    acquire() blocks the calling thread while acquire_async() only suspends the task, so
+    both the requests and the aiohttp based scrapers can use the same scheduler.
+    """
+
+    def __init__(self, limits: dict[str, tuple[int, float]] = GITHUB_RATE_LIMITS, burst: int = DEFAULT_BURST):
+        self.limits = limits
+        self.burst = burst
+        self.quotas: dict[str, Quota] = {}
+        self.lock = threading.Lock()
+
+    def get_quota(self, resource: str) -> Quota:
+        if resource not in self.quotas:
+            limit, window = self.limits.get(resource, self.limits["core"])
+            self.quotas[resource] = Quota(limit, window, self.burst)
+        return self.quotas[resource]
+
+    def reserve(self, resource: str, cost: int = 1) -> float:
+        """Books a request on the resource and returns the number of seconds to wait before sending it."""
+        with self.lock:
+            quota = self.get_quota(resource)
+            now = time.monotonic()
+            delay = max(quota.blocked_until - now, 0.0)
+
+            if quota.reset is not None and quota.reset <= now:
+                # The window is over: the new quota is unknown until a response reports it
+                quota.remaining = None
+                quota.reset = None
+                quota.tokens = float(quota.capacity)
+                quota.updated = now
+
+            if quota.remaining is None or quota.reset is None:
+                # No quota reported yet: paced at the rate documented for the resource
+                quota.refill()
+                if quota.tokens < cost:
+                    delay = max(delay, (cost - quota.tokens) / quota.rate)
+                quota.tokens -= cost
+                return delay
+
+            if quota.remaining < cost:
+                # The quota is used up: every caller waits for the reset, and the quota stays
+                # exhausted until the window is over or a response reports a new one
+                return max(delay, quota.reset - now + 1)
+
+            if quota.remaining <= quota.capacity:
+                # Few requests are left: they are spread out until the reset
+                start = max(now + delay, quota.next_request)
+                quota.next_request = start + (quota.reset - now) * cost / quota.remaining
+                delay = start - now
+            quota.remaining -= cost
+            return delay
+
+    def acquire(self, resource: str, cost: int = 1) -> None:
+        """Blocks until a request can be sent on the resource."""
+        delay = self.reserve(resource, cost)
+        if delay >= 1:
+            print(f"{resource.capitalize()} rate limit: waiting {delay:.1f} seconds...")
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, resource: str, cost: int = 1) -> None:
+        """Waits, without blocking the event loop, until a request can be sent on the resource."""
+        delay = self.reserve(resource, cost)
+        if delay >= 1:
+            print(f"{resource.capitalize()} rate limit: waiting {delay:.1f} seconds...")
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def update(self, resource: str, remaining: int, reset: float, limit: int | None = None) -> None:
+        """Records the quota reported by the API, the reset being an epoch timestamp."""
+        with self.lock:
+            quota = self.get_quota(resource)
+            if limit:
+                quota.limit = limit
+            quota.remaining = remaining
+            quota.reset = to_monotonic(reset)
+
+    def block(self, resource: str, seconds: float) -> None:
+        """Holds the requests on the resource for the given number of seconds, e.g. after a secondary rate limit."""
+        with self.lock:
+            quota = self.get_quota(resource)
+            quota.blocked_until = max(quota.blocked_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers, resource: str | None = None) -> None:
+        """Records the quota sent in the X-RateLimit-* headers of a response."""
+        headers = {key.lower(): value for key, value in headers.items()}
+
+        if "retry-after" in headers:
+            self.block(resource or headers.get("x-ratelimit-resource", "core"), float(headers["retry-after"]))
+
+        if "x-ratelimit-remaining" not in headers or "x-ratelimit-reset" not in headers:
+            return
+        self.update(
+            resource or headers.get("x-ratelimit-resource", "core"),
+            remaining=int(headers["x-ratelimit-remaining"]),
+            reset=float(headers["x-ratelimit-reset"]),
+            limit=int(headers["x-ratelimit-limit"]) if "x-ratelimit-limit" in headers else None,
+        )
+
+    def update_from_graphql(self, rate_limit: dict, resource: str = "graphql") -> None:
+        """Records the quota sent in the rateLimit { cost remaining resetAt } field of a GraphQL result."""
+        reset = datetime.fromisoformat(rate_limit["resetAt"].replace("Z", "+00:00")).timestamp()
+        self.update(resource, remaining=rate_limit["remaining"], reset=reset, limit=rate_limit.get("limit"))
@@ -1,23 +1,206 @@
+import sys
+
+import pandas as pd
+
+
+def intern(value: str | None) -> str | None:
+    """Shares the strings repeated across many repositories (e.g. languages) instead of copying them."""
+    return sys.intern(value) if value else value
+
+
+def get_codemeta_value(metadata: dict, key: str):
+    """Gets a CodeMeta property, whether its key is compact or expanded and its value wrapped or not."""
+    for name in (key, f"schema:{key}", f"http://schema.org/{key}", f"https://schema.org/{key}", f"codemeta:{key}"):
+        if name in metadata:
+            value = metadata[name]
+            break
+    else:
+        return None
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = value.get("@value", value.get("name", value.get("@id")))
+    return value
+
+
 class Repository:
+    """A repository, built from the payload of any of the APIs the scrapers use.
+
+    Only the fields the analysis needs are kept, in slots instead of a dictionary per
+    repository, and the language names are interned, which makes a record several times
+    smaller than the nested payload it comes from.
+    """
+
+    __slots__ = (
+        "name", "description", "url", "forks", "stars", "language", "contributors", "commits", "open_issues",
+        "id", "owner", "languages", "created_at", "pushed_at", "archived_at", "disk_usage", "is_fork",
+        "latest_commit", "source",
+    )
+
     name: str
-    description: str
+    description: str | None
     url: str
-    forks: int
-    stars: int
-    language: str
-    contributors: list[str]
-    commits: list
-    open_issues: list
-    
-    
-    def __init__(self, name, description, url, forks, stars, language, contributors, commits, open_issues):
+    forks: int | None
+    stars: int | None
+    language: str | None
+    contributors: int | None
+    commits: int | None
+    open_issues: int | None
+    id: str | None
+    owner: str | None
+    # (name, size in bytes) of the languages, largest first
+    languages: tuple[tuple[str, int], ...]
+    created_at: str | None
+    pushed_at: str | None
+    archived_at: str | None
+    disk_usage: int | None
+    is_fork: bool | None
+    latest_commit: str | None
+    source: str | None
+
+    def __init__(self, name, description, url, forks, stars, language, contributors=None, commits=None, open_issues=None, *, id=None, owner=None, languages=(), created_at=None, pushed_at=None, archived_at=None, disk_usage=None, is_fork=None, latest_commit=None, source=None):
         self.name = name
         self.description = description
         self.url = url
         self.forks = forks
         self.stars = stars
-        self.language = language
+        self.language = intern(language)
         self.contributors = contributors
         self.commits = commits
         self.open_issues = open_issues
-    
\ No newline at end of file
+        self.id = id
+        self.owner = owner
+        self.languages = tuple((intern(language_name), size) for language_name, size in languages)
+        self.created_at = created_at
+        self.pushed_at = pushed_at
+        self.archived_at = archived_at
+        self.disk_usage = disk_usage
+        self.is_fork = is_fork
+        self.latest_commit = latest_commit
+        self.source = source
+
+    @classmethod
+    def from_graphql_node(cls, node: dict) -> "Repository":
+        """Creates a repository from a node of the getRepos query, enriched or not."""
+        languages = tuple(
+            (edge["node"]["name"], edge["size"]) for edge in (node.get("languages") or {}).get("edges", [])
+        )
+        latest_commit = node.get("latest_commit")
+        if latest_commit is None:
+            target = (node.get("defaultBranchRef") or {}).get("target") or {}
+            latest_commit = target.get("oid")
+        open_issues = node.get("open_issues")
+        if open_issues is None and node.get("issues"):
+            open_issues = node["issues"]["totalCount"]
+        return cls(
+            name=node["name"],
+            description=node.get("description"),
+            url=node["url"],
+            forks=node.get("forkCount"),
+            stars=node.get("stargazerCount"),
+            language=languages[0][0] if languages else None,
+            contributors=node.get("contributors"),
+            commits=node.get("commits"),
+            open_issues=open_issues,
+            id=node.get("id"),
+            owner=node["owner"]["login"] if node.get("owner") else None,
+            languages=languages,
+            created_at=node.get("createdAt"),
+            pushed_at=node.get("pushedAt"),
+            archived_at=node.get("archivedAt"),
+            disk_usage=node.get("diskUsage"),
+            is_fork=node.get("isFork"),
+            latest_commit=latest_commit,
+            source="github",
+        )
+
+    @classmethod
+    def from_rest_item(cls, item: dict) -> "Repository":
+        """Creates a repository from an item of the REST search (or a /repos/{owner}/{repo} response)."""
+        return cls(
+            name=item["name"],
+            description=item.get("description"),
+            url=item["html_url"],
+            forks=item.get("forks_count"),
+            stars=item.get("stargazers_count"),
+            language=item.get("language"),
+            open_issues=item.get("open_issues_count"),
+            id=item.get("node_id"),
+            owner=item["owner"]["login"] if item.get("owner") else None,
+            created_at=item.get("created_at"),
+            pushed_at=item.get("pushed_at"),
+            disk_usage=item.get("size"),
+            is_fork=item.get("fork"),
+            source="github",
+        )
+
+    @classmethod
+    def from_swh_entry(cls, entry: dict) -> "Repository":
+        """Creates a repository from an origin of the Software Heritage metadata search.
+
+        The metadata are CodeMeta documents, which only some origins fill in, so every
+        field but the URL may be missing.
+        """
+        metadata = entry.get("metadata") or {}
+        # Older versions of the API wrap the document with the tool that extracted it
+        if isinstance(metadata.get("metadata"), dict):
+            metadata = metadata["metadata"]
+        url = entry["url"]
+        name = get_codemeta_value(metadata, "name") or url.rstrip("/").split("/")[-1]
+        return cls(
+            name=name,
+            description=get_codemeta_value(metadata, "description"),
+            url=url,
+            forks=None,
+            stars=None,
+            language=get_codemeta_value(metadata, "programmingLanguage"),
+            source="software_heritage",
+        )
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Repository) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"Repository({self.owner}/{self.name}, {self.url})"
+
+
+class RepositoryBatch:
+    """Many repositories stored as one list per field, for bulk analysis.
+
+        batch = RepositoryBatch.from_repositories(Repository.from_graphql_node(node) for node in nodes)
+        batch.to_dataframe()[["stars", "forks", "language"]]
+    """
+
+    def __init__(self, columns: dict[str, list] | None = None):
+        self.columns = columns or {field: [] for field in Repository.__slots__}
+
+    @classmethod
+    def from_repositories(cls, repositories) -> "RepositoryBatch":
+        batch = cls()
+        for repository in repositories:
+            batch.append(repository)
+        return batch
+
+    def append(self, repository: Repository) -> None:
+        for field, column in self.columns.items():
+            column.append(getattr(repository, field))
+
+    def __len__(self) -> int:
+        return len(self.columns["url"])
+
+    def __getitem__(self, index: int) -> Repository:
+        values = {field: column[index] for field, column in self.columns.items()}
+        positional = [values.pop(field) for field in Repository.__slots__[:9]]
+        return Repository(*positional, **values)
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    def column(self, field: str) -> list:
+        return self.columns[field]
+
+    def to_dataframe(self, fields: list[str] | None = None) -> pd.DataFrame:
+        return pd.DataFrame({field: self.columns[field] for field in fields or self.columns})
@@ -0,0 +1,141 @@
+import asyncio
+import re
+import time
+
+import requests
+
+from rate_limiter import is_rate_limited, get_rate_limit_delay
+from token_pool import TokenPoolAuth
+from github_session import GitHubSession, create_aliased_request
+
+# Number of aliased repositories counted by a single GraphQL request
+COMMIT_COUNT_BATCH_SIZE = 50
+# Number of times a 202 "computing" or server error response is requested again before giving up
+COMPUTING_RETRIES = 5
+# Number of rate-limited responses after which a count is given up
+RATE_LIMIT_RETRIES = 10
+# Statuses answered by the list endpoints of empty repositories: 204 (contributors) and 409 (commits)
+EMPTY_REPOSITORY_STATUSES = (204, 409)
+
+LAST_PAGE_PATTERN = re.compile(r'<[^>]*[?&]page=(\d+)[^>]*>;\s*rel="last"')
+
+
+def get_last_page(link_header: str | None) -> int | None:
+    """Gets the number of the last page from a Link header, None when there is a single page."""
+    if not link_header:
+        return None
+    match = LAST_PAGE_PATTERN.search(link_header)
+    return int(match.group(1)) if match else None
+
+
+def count_from_response(status: int, headers, data) -> int:
+    """Counts the items of a list endpoint requested with per_page=1, from a 200 or empty repository response.
+
+    With one item per page, the number of the last page is the number of items, so a
+    single small response is enough. Empty repositories are counted as 0.
+    """
+    if status in EMPTY_REPOSITORY_STATUSES:
+        return 0
+
+    last_page = get_last_page(headers.get("Link") or headers.get("link"))
+    if last_page is not None:
+        return last_page
+    return len(data) if data else 0
+
+
+def is_countable(status: int) -> bool:
+    return status == 200 or status in EMPTY_REPOSITORY_STATUSES
+
+
+def should_retry(status: int) -> bool:
+    """Tells if a count must be requested again: GitHub is still computing the list (202) or failed (5xx)."""
+    return status == 202 or status >= 500
+
+
+def count_items(session: requests.Session, url: str) -> int | None:
+    """Counts the items of a REST list endpoint, e.g. the contributors or the commits of a repository.
+
+    Requests rejected by the rate limit are sent again once the token pool of the session
+    (TokenPoolAuth) allows it, or after the reset given by the response when the session
+    is not paced, at most RATE_LIMIT_RETRIES times. None means the items could not be
+    counted, e.g. the repository is not accessible anymore or GitHub kept failing, and
+    must not be mistaken for 0.
+    """
+    attempt = 0
+    rate_limited = 0
+    while attempt < COMPUTING_RETRIES and rate_limited < RATE_LIMIT_RETRIES:
+        response = session.get(url, params={"per_page": 1})
+        if is_rate_limited(response.status_code, response.headers):
+            rate_limited += 1
+            if isinstance(session.auth, TokenPoolAuth):
+                print("Rate limit exceeded. Retrying with the next available token...")
+            else:
+                delay = get_rate_limit_delay(response.headers)
+                print(f"Rate limit exceeded. Waiting {delay:.0f} seconds...")
+                time.sleep(delay)
+            continue
+        if is_countable(response.status_code):
+            try:
+                data = response.json() if response.status_code == 200 else None
+            except requests.exceptions.JSONDecodeError:
+                print("Error: Empty or badly formatted response received from GitHub API")
+                return None
+            return count_from_response(response.status_code, response.headers, data)
+        if not should_retry(response.status_code):
+            break
+        time.sleep(2 ** attempt)
+        attempt += 1
+    print(f"Error: Unable to count the items of {url} (Status code: {response.status_code})")
+    return None
+
+
+async def count_items_async(session: GitHubSession, url: str) -> int | None:
+    """Counts the items of a REST list endpoint through a GitHubSession, which retries the rate-limited requests."""
+    for attempt in range(COMPUTING_RETRIES):
+        status, headers, data = await session.get(url, params={"per_page": 1})
+        if is_countable(status):
+            return count_from_response(status, headers, data)
+        if not should_retry(status):
+            break
+        await asyncio.sleep(2 ** attempt)
+    print(f"Error: Unable to count the items of {url} (Status code: {status})")
+    return None
+
+
+def get_repository_counts(session: requests.Session, repo_url: str) -> tuple[int | None, int | None]:
+    """Gets the exact numbers of contributors and commits of a repository from its API URL."""
+    return count_items(session, repo_url + "/contributors"), count_items(session, repo_url + "/commits")
+
+
+async def get_repository_counts_async(session: GitHubSession, repo_url: str) -> tuple[int | None, int | None]:
+    """Gets the exact numbers of contributors and commits of a repository from its API URL."""
+    contributors_count = await count_items_async(session, repo_url + "/contributors")
+    commits_count = await count_items_async(session, repo_url + "/commits")
+    return contributors_count, commits_count
+
+
+async def get_commit_counts(repositories: list[tuple[str, str]], session: GitHubSession, batch_size: int = COMMIT_COUNT_BATCH_SIZE) -> list[int | None]:
+    """Gets the number of commits of the default branch of many (owner, name) repositories.
+
+    The counts come from history { totalCount } in aliased GraphQL queries, batch_size
+    repositories per request. Empty repositories count 0 commits, the deleted or
+    inaccessible ones get None; a request that fails as a whole raises.
+    """
+    counts = []
+    for start in range(0, len(repositories), batch_size):
+        batch = repositories[start:start + batch_size]
+        request = create_aliased_request(
+            "getCommitCounts",
+            batch,
+            "defaultBranchRef { target { ... on Commit { history { totalCount } } } }",
+        )
+        result, _ = await session.execute_aliased(request)
+
+        for i in range(len(batch)):
+            node = result.get(f"repo{i}")
+            if node is None:
+                counts.append(None)
+                continue
+            target = (node["defaultBranchRef"] or {}).get("target")
+            counts.append(target["history"]["totalCount"] if target and "history" in target else 0)
+    return counts
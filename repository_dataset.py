@@ -0,0 +1,79 @@
+from datetime import date
+from typing import Iterable
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from repository import Repository, RepositoryBatch
+
+DATASET_PATH = "out/dataset"
+PARTITIONING = ["snapshot_date", "source"]
+
+LANGUAGES_TYPE = pa.list_(pa.struct([("name", pa.string()), ("size", pa.int64())]))
+REPOSITORY_SCHEMA = pa.schema([
+    ("name", pa.string()),
+    ("description", pa.string()),
+    ("url", pa.string()),
+    ("forks", pa.int64()),
+    ("stars", pa.int64()),
+    ("language", pa.string()),
+    ("contributors", pa.int64()),
+    ("commits", pa.int64()),
+    ("open_issues", pa.int64()),
+    ("id", pa.string()),
+    ("owner", pa.string()),
+    ("languages", LANGUAGES_TYPE),
+    ("created_at", pa.string()),
+    ("pushed_at", pa.string()),
+    ("archived_at", pa.string()),
+    ("disk_usage", pa.int64()),
+    ("is_fork", pa.bool_()),
+    ("latest_commit", pa.string()),
+    ("source", pa.string()),
+])
+
+
+def repositories_to_table(repositories: Iterable[Repository]) -> pa.Table:
+    """Converts repositories to an Arrow table, the languages being a list of (name, size) structs."""
+    batch = RepositoryBatch.from_repositories(repositories)
+    columns = dict(batch.columns)
+    columns["languages"] = [
+        [{"name": name, "size": size} for name, size in languages] for languages in columns["languages"]
+    ]
+    return pa.Table.from_pydict(columns, schema=REPOSITORY_SCHEMA)
+
+
+def write_dataset(repositories: Iterable[Repository], snapshot_date: date | None = None, path: str = DATASET_PATH) -> None:
+    """Writes repositories to a Parquet dataset partitioned by snapshot date and source.
+
+    The files are laid out as <path>/snapshot_date=<date>/source=<source>/, so a loader
+    only reads the partitions it asks for. Writing a snapshot again on the same date
+    replaces the partitions of its sources.
+    """
+    table = repositories_to_table(repositories)
+    table = table.append_column("snapshot_date", pa.array([(snapshot_date or date.today()).isoformat()] * len(table), pa.string()))
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([(field, pa.string()) for field in PARTITIONING]), flavor="hive"),
+        existing_data_behavior="delete_matching",
+    )
+    print(f"{len(table)} repositories written to {path}")
+
+
+def load_dataset(columns: list[str] | None = None, path: str = DATASET_PATH, snapshot_date: date | str | None = None, source: str | None = None) -> pd.DataFrame:
+    """Loads the given columns of a Parquet dataset, from one snapshot date and source if given.
+
+    The files are memory-mapped and only the requested columns and partitions are read,
+    e.g. load_dataset(["stars", "forks", "language"]).
+    """
+    filters = []
+    if snapshot_date is not None:
+        filters.append(("snapshot_date", "=", str(snapshot_date)))
+    if source is not None:
+        filters.append(("source", "=", source))
+    table = pq.read_table(path, columns=columns, filters=filters or None, memory_map=True, partitioning="hive")
+    return table.to_pandas()
@@ -0,0 +1,88 @@
+import asyncio
+
+from github_session import GitHubSession, create_aliased_request
+from github_scraper import REPOSITORY_FIELDS, set_latest_commit, set_latest_commit_from_node
+from repository_counts import count_items_async
+
+# Number of aliased repositories fetched by a single GraphQL request
+ENRICHMENT_BATCH_SIZE = 50
+
+ENRICHMENT_FIELDS = REPOSITORY_FIELDS + """
+    issues(states: OPEN) { totalCount }
+    defaultBranchRef { target { oid ... on Commit { history { totalCount } } } }
+"""
+
+
+def parse_repository_pair(repository: str) -> tuple[str, str] | None:
+    """Gets the (owner, name) pair of an "owner/name" string or a GitHub URL, None for other hosts."""
+    repository = repository.strip()
+    if "://" in repository or repository.startswith(("github.com", "www.github.com")):
+        if "github.com/" not in repository:
+            return None
+        repository = repository.split("github.com/", 1)[1]
+    parts = [part for part in repository.split("/") if part]
+    if len(parts) < 2:
+        return None
+    name = parts[1][:-len(".git")] if parts[1].endswith(".git") else parts[1]
+    return parts[0], name
+
+
+def compare_repository(owner: str, name: str, node: dict) -> str:
+    """Tells whether a repository was found under the requested name, renamed or transferred."""
+    if node["owner"]["login"].lower() != owner.lower():
+        return "transferred"
+    if node["name"].lower() != name.lower():
+        return "renamed"
+    return "found"
+
+
+async def enrich_repositories(repositories: list[tuple[str, str]], session: GitHubSession, batch_size: int = ENRICHMENT_BATCH_SIZE, with_contributors: bool = False) -> tuple[list, list]:
+    """Fetches the getRepos fields of many (owner, name) repositories, batch_size per GraphQL request.
+
+    GitHub follows renames and transfers, so a repository may come back under another
+    name; the same repository requested twice is only returned once. Each repository also
+    gets its latest commit, its number of commits and of open issues, and, with_contributors,
+    its number of contributors (one REST request each). Returns the repositories and a
+    report of the requested ones that were renamed, transferred or not found, with the
+    reason given by GitHub (e.g. NOT_FOUND for a deleted or private repository).
+    """
+    found = {}
+    report = []
+    for start in range(0, len(repositories), batch_size):
+        batch = repositories[start:start + batch_size]
+        print(f"Fetching repositories {start}-{start + len(batch)}/{len(repositories)}")
+        request = create_aliased_request("getRepositories", batch, ENRICHMENT_FIELDS)
+        result, errors = await session.execute_aliased(request)
+
+        for i, (owner, name) in enumerate(batch):
+            node = result.get(f"repo{i}")
+            if node is None:
+                report.append({"requested": f"{owner}/{name}", "status": "missing", "reason": errors.get(f"repo{i}", "ERROR")})
+                continue
+
+            status = compare_repository(owner, name, node)
+            if status != "found":
+                report.append({"requested": f"{owner}/{name}", "status": status, "url": node["url"]})
+            if node["id"] in found:
+                continue
+
+            target = (node.get("defaultBranchRef") or {}).get("target") or {}
+            node["commits"] = target.get("history", {}).get("totalCount", 0)
+            node["open_issues"] = node.pop("issues")["totalCount"]
+            set_latest_commit_from_node(node)
+            if "latest_commit" not in node:
+                set_latest_commit(node, "")
+            found[node["id"]] = node
+
+    repositories = list(found.values())
+    if with_contributors:
+        counts = await asyncio.gather(*(
+            count_items_async(session, f"/repos/{repository['owner']['login']}/{repository['name']}/contributors")
+            for repository in repositories
+        ))
+        for repository, count in zip(repositories, counts):
+            repository["contributors"] = count
+
+    counts = {status: sum(1 for entry in report if entry["status"] == status) for status in ("renamed", "transferred", "missing")}
+    print(f"{len(repositories)} repositories fetched: {counts['renamed']} renamed, {counts['transferred']} transferred and {counts['missing']} missing")
+    return repositories, report
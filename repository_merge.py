@@ -0,0 +1,137 @@
+import re
+
+from typing import Iterable, NamedTuple
+from urllib.parse import urlsplit
+
+# Hosts whose repository URLs are made of an owner and a name, anything after is a page of
+# the repository (GitLab is not one of them because of its nested groups)
+FORGE_HOSTS = {"github.com", "bitbucket.org", "codeberg.org"}
+SCP_URL_PATTERN = re.compile(r"^[\w.-]+@([\w.-]+):(.*)$")
+
+
+def canonical_url(url: str) -> str:
+    """Normalizes a repository URL so that the variants of a same URL get the same key.
+
+    The scheme, credentials, "www.", query, fragment, trailing slash and ".git" suffix are
+    dropped and the URL is lowercased, e.g. git@github.com:Owner/Repo.git and
+    http://www.github.com/owner/repo/ both become https://github.com/owner/repo. Pages of a
+    repository on a known forge (e.g. /tree/main) and GitHub API URLs lead to the repository.
+    """
+    url = url.strip().lower()
+    match = SCP_URL_PATTERN.match(url)
+    if match:
+        url = f"ssh://{match.group(1)}/{match.group(2)}"
+    if "://" not in url:
+        url = "https://" + url
+
+    parts = urlsplit(url)
+    host = parts.hostname or ""
+    if host.startswith("www."):
+        host = host[len("www."):]
+    path = [part for part in parts.path.split("/") if part]
+
+    if host == "api.github.com" and path[:1] == ["repos"]:
+        host = "github.com"
+        path = path[1:]
+    if host in FORGE_HOSTS:
+        path = path[:2]
+    if path and path[-1].endswith(".git"):
+        path[-1] = path[-1][:-len(".git")]
+    return "/".join([f"https://{host}", *path])
+
+
+class Source(NamedTuple):
+    """Records of one data source and the names of their URL and GitHub node id fields."""
+    name: str
+    records: Iterable[dict]
+    url_field: str = "url"
+    id_field: str | None = "id"
+
+
+class RepositoryIndex:
+    """Hash index from GitHub node ids and canonical URLs to merged repositories.
+
+    A record is joined on its node id when it has one, and on its canonical URL otherwise,
+    so a renamed repository is still joined with its previous URL once both point to the
+    same node id. Known redirections (e.g. the renamed and transferred repositories
+    reported by repository_enrichment) can also be given as aliases from an old URL to a
+    new one. Lookups cost a few dictionary accesses whatever the number of repositories.
+    """
+
+    def __init__(self, aliases: dict[str, str] | None = None):
+        self.ids: dict[str, int] = {}
+        self.urls: dict[str, int] = {}
+        self.aliases = {canonical_url(old): canonical_url(new) for old, new in (aliases or {}).items()}
+        self.repositories: list[dict] = []
+        self.provenance: list[dict[str, str]] = []
+
+    def resolve(self, url: str) -> str:
+        key = canonical_url(url)
+        # Follows chains of redirections, e.g. a repository renamed twice
+        seen = set()
+        while key in self.aliases and key not in seen:
+            seen.add(key)
+            key = self.aliases[key]
+        return key
+
+    def find(self, url: str | None, node_id: str | None = None) -> int | None:
+        """Position of the merged repository having the node id or the URL, None if there is none."""
+        if node_id and node_id in self.ids:
+            return self.ids[node_id]
+        if url:
+            return self.urls.get(self.resolve(url))
+        return None
+
+    def add(self, source: str, record: dict, url: str | None, node_id: str | None = None) -> int:
+        """Merges a record into the repository it matches, or adds it, and returns its position.
+
+        The fields already set by an earlier source are kept, the others are taken from the
+        record and credited to its source.
+        """
+        position = self.find(url, node_id)
+        if position is None:
+            position = len(self.repositories)
+            self.repositories.append({"sources": []})
+            self.provenance.append({})
+
+        repository = self.repositories[position]
+        provenance = self.provenance[position]
+        repository["sources"].append(source)
+        for field, value in record.items():
+            if value is None or value != value:
+                # Missing values (None or NaN) do not hide the ones of other sources
+                continue
+            if field not in repository:
+                repository[field] = value
+                provenance[field] = source
+
+        if node_id:
+            self.ids.setdefault(node_id, position)
+        if url:
+            self.urls.setdefault(self.resolve(url), position)
+        return position
+
+    def merged(self) -> list[dict]:
+        """The merged repositories, with their canonical URL and the source of each field."""
+        merged = []
+        keys = {position: key for key, position in reversed(list(self.urls.items()))}
+        for position, repository in enumerate(self.repositories):
+            merged.append({**repository, "canonical_url": keys.get(position), "provenance": self.provenance[position]})
+        return merged
+
+
+def merge_sources(sources: list[Source], aliases: dict[str, str] | None = None) -> list[dict]:
+    """Merges the repositories of several sources, the first sources having priority for each field.
+
+        merge_sources([
+            Source("github", github_repositories, url_field="URL"),
+            Source("swh", swh_origins, id_field=None),
+        ])
+    """
+    index = RepositoryIndex(aliases)
+    for source in sources:
+        for record in source.records:
+            url = record.get(source.url_field)
+            node_id = record.get(source.id_field) if source.id_field else None
+            index.add(source.name, record, url if isinstance(url, str) else None, node_id if isinstance(node_id, str) else None)
+    return index.merged()
@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+
+import pandas as pd
+
+from repository_merge import canonical_url
+
+REPOSITORY_STORE_PATH = "out/repos_metadata.sqlite"
+# Separator of the keywords of a repository in the exported CSV files
+KEYWORDS_SEPARATOR = "|"
+
+
+def as_keyword_list(keywords) -> list[str]:
+    """The search keywords of a repository as a list, whether stored as a list or as a single keyword."""
+    if keywords is None or (isinstance(keywords, float) and keywords != keywords):
+        return []
+    if isinstance(keywords, str):
+        return [keywords]
+    return list(keywords)
+
+
+class RepositoryStore:
+    """SQLite store of repository metadata, with a unique index on the canonical URL.
+
+    Pages of results are upserted as they arrive, so storing the results of a keyword only
+    costs as much as its own results, whatever the size of the store. The store also
+    serves as the set of repositories already seen, across runs: the fields of a repository
+    found again are updated with the given ones, and its search_keyword list collects every
+    keyword that matched it.
+
+    The keywords that matched each repository are also indexed in a keyword x repository
+    join table, along with the number of repositories of each keyword and how many of them
+    only this keyword found. These counts are maintained as pages are upserted, so the
+    contribution of every keyword is read without scanning the matches.
+    """
+
+    def __init__(self, path: str = REPOSITORY_STORE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS repositories (
+                url TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                data TEXT NOT NULL
+            )""")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS keywords (
+                id INTEGER PRIMARY KEY,
+                keyword TEXT NOT NULL UNIQUE,
+                repositories INTEGER NOT NULL DEFAULT 0,
+                unique_repositories INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS matches (
+                keyword INTEGER NOT NULL,
+                repository INTEGER NOT NULL,
+                PRIMARY KEY (keyword, repository)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS matches_repository ON matches (repository, keyword);
+        """)
+        self.connection.commit()
+        if len(self) and self.connection.execute("SELECT COUNT(*) FROM matches").fetchone()[0] == 0:
+            # Stores created before the keyword index
+            self.rebuild_keyword_index()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM repositories").fetchone()[0]
+
+    def __contains__(self, url: str) -> bool:
+        return self.connection.execute(
+            "SELECT 1 FROM repositories WHERE url = ?", (canonical_url(url),)
+        ).fetchone() is not None
+
+    def get(self, urls: list[str]) -> dict[str, dict]:
+        """Gets the stored repositories among the given URLs, by canonical URL."""
+        keys = list({canonical_url(url) for url in urls})
+        stored = {}
+        # SQLite limits the number of parameters of a query
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self.connection.execute(
+                f"SELECT url, data FROM repositories WHERE url IN ({', '.join('?' * len(batch))})", batch
+            )
+            stored.update((url, json.loads(data)) for url, data in rows)
+        return stored
+
+    def upsert(self, repositories: list[dict]) -> None:
+        """Inserts or updates a page of repositories, each having a "url" field.
+
+        The fields missing from a given repository keep their stored value.
+        """
+        stored = self.get([repository["url"] for repository in repositories])
+        position = len(self)
+        rows = []
+        for repository in repositories:
+            key = canonical_url(repository["url"])
+            previous = stored.get(key, {})
+            keywords = as_keyword_list(previous.get("search_keyword"))
+            keywords += [keyword for keyword in as_keyword_list(repository.get("search_keyword")) if keyword not in keywords]
+            repository = {**previous, **repository, "search_keyword": keywords}
+            stored[key] = repository
+            rows.append((key, position, json.dumps(repository)))
+            position += 1
+        # The position of a repository is the one of its first insertion
+        self.connection.executemany("""
+            INSERT INTO repositories (url, position, data) VALUES (?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET data = excluded.data""", rows)
+        self.index_keywords({key: repository["search_keyword"] for key, repository in stored.items()})
+        self.connection.commit()
+
+    def index_keywords(self, keywords_by_url: dict[str, list[str]]) -> None:
+        """Adds the keywords of repositories, by canonical URL, to the keyword index."""
+        keywords = {keyword for keywords in keywords_by_url.values() for keyword in keywords}
+        self.connection.executemany("INSERT OR IGNORE INTO keywords (keyword) VALUES (?)", [(keyword,) for keyword in keywords])
+        keyword_ids = {}
+        for keyword in keywords:
+            keyword_ids[keyword] = self.connection.execute("SELECT id FROM keywords WHERE keyword = ?", (keyword,)).fetchone()[0]
+
+        for url, repository_keywords in keywords_by_url.items():
+            repository_id = self.connection.execute("SELECT rowid FROM repositories WHERE url = ?", (url,)).fetchone()[0]
+            existing = [keyword for (keyword,) in self.connection.execute("SELECT keyword FROM matches WHERE repository = ?", (repository_id,))]
+            new = [keyword_ids[keyword] for keyword in dict.fromkeys(repository_keywords) if keyword_ids[keyword] not in existing]
+            if not new:
+                continue
+            self.connection.executemany("INSERT INTO matches VALUES (?, ?)", [(keyword_id, repository_id) for keyword_id in new])
+            self.connection.executemany("UPDATE keywords SET repositories = repositories + 1 WHERE id = ?", [(keyword_id,) for keyword_id in new])
+            if not existing and len(new) == 1:
+                # Only found by this keyword so far
+                self.connection.execute("UPDATE keywords SET unique_repositories = unique_repositories + 1 WHERE id = ?", (new[0],))
+            elif len(existing) == 1:
+                # Not unique to its first keyword anymore
+                self.connection.execute("UPDATE keywords SET unique_repositories = unique_repositories - 1 WHERE id = ?", (existing[0],))
+
+    def rebuild_keyword_index(self) -> None:
+        """Rebuilds the keyword index from the search_keyword lists of the stored repositories."""
+        self.connection.execute("DELETE FROM matches")
+        self.connection.execute("DELETE FROM keywords")
+        rows = self.connection.execute("SELECT url, data FROM repositories").fetchall()
+        self.index_keywords({url: as_keyword_list(json.loads(data).get("search_keyword")) for url, data in rows})
+        self.connection.commit()
+
+    def get_repository_keywords(self, url: str) -> list[str]:
+        """The keywords that found a repository."""
+        rows = self.connection.execute("""
+            SELECT keywords.keyword FROM repositories
+            JOIN matches ON matches.repository = repositories.rowid
+            JOIN keywords ON keywords.id = matches.keyword
+            WHERE repositories.url = ?""", (canonical_url(url),))
+        return [keyword for (keyword,) in rows]
+
+    def get_keyword_contributions(self) -> pd.DataFrame:
+        """The number of repositories each keyword found, and the number no other keyword found, most unique first.
+
+        A keyword without unique repositories adds nothing to the dataset.
+        """
+        return pd.read_sql_query(
+            "SELECT keyword, repositories, unique_repositories FROM keywords ORDER BY unique_repositories DESC, repositories DESC",
+            self.connection,
+        )
+
+    def get_keyword_overlaps(self, keyword: str) -> dict[str, int]:
+        """The number of repositories a keyword shares with each of the other keywords."""
+        rows = self.connection.execute("""
+            SELECT other_keywords.keyword, COUNT(*) FROM keywords
+            JOIN matches ON matches.keyword = keywords.id
+            JOIN matches AS others ON others.repository = matches.repository AND others.keyword != matches.keyword
+            JOIN keywords AS other_keywords ON other_keywords.id = others.keyword
+            WHERE keywords.keyword = ?
+            GROUP BY others.keyword ORDER BY COUNT(*) DESC""", (keyword,))
+        return dict(rows.fetchall())
+
+    def import_csv(self, path: str, sep: str = ";") -> None:
+        """Imports the repositories of a CSV file exported before, e.g. when the store is created."""
+        dataframe = pd.read_csv(path, sep=sep)
+        records = json.loads(dataframe.to_json(orient="records"))
+        for record in records:
+            if isinstance(record.get("search_keyword"), str):
+                record["search_keyword"] = record["search_keyword"].split(KEYWORDS_SEPARATOR)
+        self.upsert(records)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        rows = self.connection.execute("SELECT data FROM repositories ORDER BY position")
+        return pd.DataFrame([json.loads(data) for (data,) in rows])
+
+    def export_csv(self, path: str, sep: str = ";") -> None:
+        dataframe = self.to_dataframe()
+        if "search_keyword" in dataframe:
+            dataframe["search_keyword"] = dataframe["search_keyword"].map(KEYWORDS_SEPARATOR.join)
+        dataframe.to_csv(path, sep=sep, index=False)
+
+    def export_parquet(self, path: str) -> None:
+        """Exports the store to a Parquet file, which requires pyarrow."""
+        self.to_dataframe().to_parquet(path, index=False)
+
+    def close(self) -> None:
+        self.connection.close()
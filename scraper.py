@@ -1,99 +1,92 @@
+import os
+import asyncio
 import requests
+from urllib.parse import quote_plus
 import pandas as pd
-import time
 from tqdm import tqdm
+from rate_limiter import is_rate_limited
+from token_pool import TokenPool, TokenPoolAuth, get_github_tokens
+from repository_counts import get_repository_counts
+from http_cache import HttpCache, CachingAdapter
+from repository_store import RepositoryStore, canonical_url
+from keyword_queries import pack_keywords, build_query, match_keywords
+from keyword_clustering import collapse_keywords
+from keyword_planning import get_keyword_counts, estimate_coverage, plan_keyword_searches
+from github_session import GitHubSession
 
 outputfile = 'out/repos_metadata3.csv'
 
 # Create a session once at the beginning
 session = requests.Session()
-session.headers.update({"Authorization": f"Bearer {token}", "Accept": "application/vnd.github.v3+json"})
+session.headers.update({"Accept": "application/vnd.github.v3+json"})
 
+# Each request is sent with the token having the most remaining quota, and paced
+# according to the quota sent back by GitHub
+token_pool = TokenPool(get_github_tokens())
+session.auth = TokenPoolAuth(token_pool)
 
-def get_rate_limit():
-    """Fetches both search and core rate limits from GitHub API."""
-    url = "https://api.github.com/rate_limit"
-    response = session.get(url)
-    
-    if response.status_code == 200:
-        data = response.json()
-        return {
-            "core_remaining": data['resources']['core']['remaining'],
-            "core_reset": data['resources']['core']['reset'],
-            "search_remaining": data['resources']['search']['remaining'],
-            "search_reset": data['resources']['search']['reset']
-        }
-    
-    print("Warning: Unable to fetch rate limit status.")
-    return None
-    
-def check_requests_limit(limit_type="search"):
+# Revisited endpoints are revalidated with conditional requests, which do not cost any quota
+# when they are sent with the token that got the cached response
+http_cache = HttpCache()
+session.mount("https://api.github.com/", CachingAdapter(http_cache))
+
+
+def rate_limited_get(url):
     """
-    Ensures API requests stay within GitHub's rate limits.
-    
+    Sends a GET request once the token pool allows it.
+
+    The quota is read from the X-RateLimit-* headers of every response, so no extra
+    request is needed to check it. Requests rejected by the rate limit are sent again
+    with another token, or once the quota is reset.
+
     Args:
-        limit_type (str): "search" for search-related requests, "core" for general API requests.
+        url (str): URL of the request.
     """
-    for _ in range(5):  # Retry up to 5 times before failing
-        rate_limits = get_rate_limit()
-        if rate_limits is None:
-            print("Error: Unable to fetch rate limit. Retrying...")
-            time.sleep(5)
-            continue
-        
-        remaining = rate_limits[f"{limit_type}_remaining"]
-        reset_time = rate_limits[f"{limit_type}_reset"]
-
-        if remaining > 0:
-            return  # Safe to proceed
-        
-        wait_time = reset_time - time.time() + 1
-        if wait_time > 0:
-            print(f"{limit_type.capitalize()} rate limit exceeded. Waiting {int(wait_time)} seconds...")
-            time.sleep(wait_time)
+    while True:
+        response = session.get(url)
 
-    raise RuntimeError(f"Failed to check {limit_type} rate limit after multiple attempts.")
+        if not is_rate_limited(response.status_code, response.headers):
+            return response
+        print("Rate limit exceeded. Retrying with the next available token...")
 
 
 def get_repository_details(repo):
-    repo_url = repo['url']
-    contributors_url = repo_url + "/contributors"
-    commits_url = repo_url + "/commits"
-
-    try:
-        check_requests_limit("core")
-        contributors_response = session.get(contributors_url)
-        commits_response = session.get(commits_url)
-        contributors_count = len(contributors_response.json()) if contributors_response.status_code == 200 else 0
-        commits_count = len(commits_response.json()) if commits_response.status_code == 200 else 0
-    except requests.exceptions.JSONDecodeError:
-        contributors_count = 0
-        commits_count = 0
+    contributors_count, commits_count = get_repository_counts(session, repo['url'])
 
     open_issues_count = repo['open_issues_count']
 
     return contributors_count, commits_count, open_issues_count
 
-def search_github_repos(keyword, per_page=10, pages=1):
+def search_github_repos(keyword, per_page=10, pages=1, store=None, keywords=None):
+    """
+    Searches the repositories of a keyword, page by page.
+
+    With a store, each page is upserted into it as soon as it is fetched, along with the
+    keyword that found its repositories. The repositories already in the store, e.g. found
+    by an earlier keyword or run, only get the keyword added and the fields of the search
+    result updated: their contributors and commits are not fetched again.
+
+    When keyword is a query packing several keywords, given in keywords, each repository
+    is stored with the ones it matches.
+    """
     all_metadata = []
     
     for page in range(1, pages + 1):
         
-        check_requests_limit("search")
-        
-        url = f"https://api.github.com/search/repositories?q={keyword}&per_page={per_page}&page={page}"
+        url = f"https://api.github.com/search/repositories?q={quote_plus(keyword)}&per_page={per_page}&page={page}"
         #headers = {"Authorization": f"Bearer {token}", "Accept": "application/vnd.github.v3+json"}
         
-        response = session.get(url)
+        response = rate_limited_get(url)
         
         if response.status_code == 200:
             data = response.json()
             repos = data.get("items", [])
+            seen = store.get([repo["html_url"] for repo in repos]) if store is not None else {}
             
+            page_metadata = []
+            page_keywords = []
             for repo in repos:
 
-                contributors_count, commits_count, open_issues_count = get_repository_details(repo)
-
                 repo_data = {
                     "name": repo["name"],
                     "owner": repo["owner"]["login"],
@@ -103,37 +96,88 @@ def search_github_repos(keyword, per_page=10, pages=1):
                     "url": repo["html_url"],
                     "open_issues":repo["open_issues_count"],
                     "language":repo["language"],
-                    "Contributors":contributors_count,
-                    "Commits":commits_count, 
-                    "Open Issues":open_issues_count
                 }
-                all_metadata.append(repo_data)
+                if canonical_url(repo["html_url"]) not in seen:
+                    contributors_count, commits_count, open_issues_count = get_repository_details(repo)
+                    repo_data["Contributors"] = contributors_count
+                    repo_data["Commits"] = commits_count
+                    repo_data["Open Issues"] = open_issues_count
+                page_metadata.append(repo_data)
+                page_keywords.append(match_keywords(repo, keywords) if keywords else [keyword])
+
+            if store is not None and page_metadata:
+                store.upsert([
+                    {**repo_data, "search_keyword": matched}
+                    for repo_data, matched in zip(page_metadata, page_keywords)
+                ])
+            all_metadata.extend(page_metadata)
         else:
             print(f"Error: Unable to fetch data for page {page} (Status code: {response.status_code})")
             break
     
     return pd.DataFrame(all_metadata) if all_metadata else None
 
-def search_multiple_keywords(keywords, per_page=10, pages=1, save_path=outputfile):
-    
-    # Try to load existing data if the file exists
+def count_keywords(keywords, quoted=True):
+    """Gets the number of repositories of each keyword, with batched GraphQL counts.
+
+    With quoted, the keywords are counted as the phrases of the packed queries, otherwise
+    as they are searched one by one.
+    """
+    async def count():
+        async with GitHubSession(token_pool) as github_session:
+            return await get_keyword_counts(keywords, github_session, quoted=quoted)
+
+    return asyncio.run(count())
+
+
+def search_multiple_keywords(keywords, per_page=10, pages=1, save_path=outputfile, pack=True, collapse=True, plan=True):
+    """
+    Searches the repositories of several keywords and saves them without duplicates.
+
+    plan counts the keywords first and searches the most promising ones with the pages
+    they need (see keyword_planning), collapse skips the keywords that only differ by
+    case, separators or plurals (see keyword_clustering) and pack, given the counts of
+    plan, packs keywords into OR-queries (see keyword_queries). The results are upserted into a SQLite store next to save_path
+    and exported to the CSV file at the end.
+    """
+    # The counts, pages and packed queries are all keyed by the stripped keywords
+    keywords = list(dict.fromkeys(keyword.strip() for keyword in keywords if keyword.strip()))
+
+    store = RepositoryStore(os.path.splitext(save_path)[0] + ".sqlite")
+    if len(store) == 0 and os.path.exists(save_path):
+        store.import_csv(save_path)
+
+    counts = count_keywords(keywords, quoted=pack) if plan else None
+    if collapse:
+        collapsed = collapse_keywords(keywords, counts=counts)
+        print(f"{len(collapsed)} keywords searched out of {len(keywords)}, the others being duplicates or covered by another keyword")
+        keywords = collapsed
+    keyword_pages = {keyword: pages for keyword in keywords}
+    if plan:
+        coverage = estimate_coverage(keywords, store.to_dataframe().to_dict("records"))
+        plans = plan_keyword_searches({keyword: counts[keyword] for keyword in keywords if keyword in counts}, coverage, per_page=per_page, max_pages=pages)
+        # The keywords that could not be counted are searched last, with all the pages
+        unknown = [keyword for keyword in keywords if keyword not in counts]
+        if unknown:
+            print(f"{len(unknown)} keywords could not be counted and are searched with {pages} pages")
+        keywords = [keyword_plan.keyword for keyword_plan in plans] + unknown
+        keyword_pages.update({keyword_plan.keyword: keyword_plan.pages for keyword_plan in plans})
+
+    if pack and counts is None:
+        print("Keywords are searched one by one: they are only packed given their counts (plan)")
     try:
-        existing_df = pd.read_csv(save_path,sep=';',)
-    except FileNotFoundError:
-        existing_df = pd.DataFrame()
-
-    for keyword in tqdm(keywords):
-        df = search_github_repos(keyword, per_page, pages)
-        if df is not None:
-            df["search_keyword"] = keyword  # Add keyword column to track origin
-            
-            # Combine with existing data if available
-            combined_df = pd.concat([existing_df, df], ignore_index=True)
-            combined_df.drop_duplicates(subset=["url"], inplace=True)
-            
-            # Save the updated DataFrame
-            combined_df.to_csv(save_path, sep=';', index=False)
-            existing_df = combined_df  # Update existing_df for next iterations
+        if pack:
+            for group in tqdm(pack_keywords(keywords, counts=counts)):
+                group_pages = min(pages, sum(keyword_pages[keyword] for keyword in group))
+                search_github_repos(build_query(group), per_page, group_pages, store=store, keywords=group)
+        else:
+            for keyword in tqdm(keywords):
+                search_github_repos(keyword, per_page, keyword_pages[keyword], store=store)
+    finally:
+        # Saves what was found even if the search is interrupted
+        store.export_csv(save_path)
+        existing_df = store.to_dataframe()
+        store.close()
 
     return existing_df
 
@@ -143,4 +187,6 @@ keywords_DB_df = pd.read_csv("out/keywords_database.csv")
 
 keywords = keywords_DB_df["Keywords"].tolist()
 
-search_multiple_keywords(keywords, per_page=10, pages=100)
\ No newline at end of file
+search_multiple_keywords(keywords, per_page=10, pages=100)
+
+print(http_cache.stats())
\ No newline at end of file
@@ -1,28 +1,154 @@
-import requests
-import time
-from typing import Any
-
-def search_projects_by_metadata(query: str, max_results: int, per_page: int=50) -> list:
-    metarequest = 0
-    projects = []
-    base_url = "https://archive.softwareheritage.org/api/1/origin/metadata-search/"
-    params: dict[str, Any] = {"fulltext": query, "per_page": per_page}
-    next_page = base_url
-
-    while next_page and metarequest < max_results:
-        metarequest += 50
-        response = requests.get(next_page, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            projects.extend(data)  # Add the results
-            # The Software Heritage API does not always provide a "next" link
-            if len(data) < 50:
-                break  # No more pages to retrieve
-
-            time.sleep(1)
-
-        else:
-            print("Error during request:", response.status_code, response.text)
-            break
-
-    return projects
\ No newline at end of file
+import asyncio
+import json
+import os
+import re
+
+import aiohttp
+
+from typing import Any, AsyncIterator
+from urllib.parse import urlencode
+from rate_limiter import RateLimitScheduler, is_rate_limited
+
+SWH_API_URL = "https://archive.softwareheritage.org/api/1"
+# Requests allowed by the archive per hour, anonymously and with a token (SWH_TOKEN)
+SWH_RATE_LIMITS = {"core": (120, 3600)}
+SWH_AUTHENTICATED_RATE_LIMITS = {"core": (1200, 3600)}
+# Number of requests that can be sent back to back before being paced
+SWH_BURST = 10
+# Number of queries fetched at the same time
+SWH_CONCURRENCY = 4
+# Number of pages waiting for the consumer
+SWH_QUEUE_SIZE = 8
+
+NEXT_PAGE_PATTERN = re.compile(r'<([^>]*)>;\s*rel="next"')
+
+
+def get_next_link(link_header: str | None) -> str | None:
+    """Gets the URL of the next page from a Link header, None on the last page."""
+    if not link_header:
+        return None
+    match = NEXT_PAGE_PATTERN.search(link_header)
+    return match.group(1) if match else None
+
+
+class SoftwareHeritageSession:
+    """A connection pool to the Software Heritage API shared by concurrent queries.
+
+    Requests are paced by a RateLimitScheduler, corrected by the X-RateLimit-* headers sent
+    back by the archive, so the queries only wait when the quota is used up. The token of
+    the SWH_TOKEN environment variable, if any, is sent to get the authenticated quota.
+
+        async with SoftwareHeritageSession() as session:
+            async for query, page in iter_projects_for_queries(queries, session):
+                ...
+    """
+
+    def __init__(self, token: str | None = None, api_url: str = SWH_API_URL, scheduler: RateLimitScheduler | None = None, pool_size: int = SWH_CONCURRENCY):
+        self.token = token if token is not None else os.environ.get("SWH_TOKEN")
+        self.api_url = api_url
+        self.scheduler = scheduler or RateLimitScheduler(
+            SWH_AUTHENTICATED_RATE_LIMITS if self.token else SWH_RATE_LIMITS, burst=SWH_BURST
+        )
+        self.pool_size = pool_size
+
+    async def __aenter__(self) -> "SoftwareHeritageSession":
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        self.http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size), headers=headers)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.http.close()
+
+    async def get(self, url: str, params: dict | None = None) -> tuple[int, dict, Any]:
+        """Sends a GET request and returns its status, headers and JSON body (None if not JSON)."""
+        if url.startswith("/"):
+            url = self.api_url + url
+        if params:
+            url = f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+
+        while True:
+            await self.scheduler.acquire_async("core")
+            try:
+                async with self.http.get(url) as response:
+                    self.scheduler.update_from_headers(response.headers, resource="core")
+                    if is_rate_limited(response.status, response.headers):
+                        print("Software Heritage rate limit exceeded, waiting for the reset.")
+                        continue
+                    body = await response.read()
+            except aiohttp.ClientConnectionError as error:
+                print(f"{type(error).__name__}: retrying...")
+                continue
+
+            try:
+                data = json.loads(body) if body.strip() else None
+            except ValueError:
+                data = None
+            return response.status, dict(response.headers), data
+
+
+async def iter_projects_by_metadata(query: str, session: SoftwareHeritageSession, per_page: int = 50, max_results: int | None = None) -> AsyncIterator[list]:
+    """Yields the pages of origins whose metadata match a full-text query.
+
+    The pages are followed through the Link rel="next" header until the last one, or until
+    max_results origins were yielded.
+    """
+    url = f"/origin/metadata-search/?{urlencode({'fulltext': query, 'limit': per_page})}"
+    fetched = 0
+    while url and (max_results is None or fetched < max_results):
+        status, headers, data = await session.get(url)
+        if status != 200:
+            print("Error during request:", status, data)
+            return
+        if not data:
+            return
+        if max_results is not None:
+            data = data[:max_results - fetched]
+        fetched += len(data)
+        yield data
+        url = get_next_link(headers.get("Link") or headers.get("link"))
+
+
+async def iter_projects_for_queries(queries: list[str], session: SoftwareHeritageSession, per_page: int = 50, max_results: int | None = None, concurrency: int = SWH_CONCURRENCY, queue_size: int = SWH_QUEUE_SIZE) -> AsyncIterator[tuple[str, list]]:
+    """Yields (query, page) pairs as soon as they are fetched, several queries being fetched at the same time.
+
+    The pages of a query come in order, but the pages of different queries are interleaved.
+    At most queue_size pages wait for the consumer, which bounds the memory used.
+    """
+    queries_queue: asyncio.Queue = asyncio.Queue()
+    for query in queries:
+        queries_queue.put_nowait(query)
+    pages: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def worker() -> None:
+        while not queries_queue.empty():
+            query = queries_queue.get_nowait()
+            async for page in iter_projects_by_metadata(query, session, per_page=per_page, max_results=max_results):
+                await pages.put((query, page))
+
+    async def run_workers() -> None:
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+        finally:
+            # Tells the consumer that there are no more pages
+            await pages.put(None)
+
+    producer = asyncio.create_task(run_workers())
+    try:
+        while (item := await pages.get()) is not None:
+            yield item
+        # Raises the error of a worker, if any
+        await producer
+    finally:
+        producer.cancel()
+
+
+def search_projects_by_metadata(query: str, max_results: int | None = None, per_page: int = 50) -> list:
+    """Fetches every origin whose metadata match a full-text query, or the first max_results ones."""
+    async def collect() -> list:
+        projects = []
+        async with SoftwareHeritageSession() as session:
+            async for page in iter_projects_by_metadata(query, session, per_page=per_page, max_results=max_results):
+                projects.extend(page)
+        return projects
+
+    return asyncio.run(collect())
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+
+import requests
+
+from rate_limiter import GITHUB_RATE_LIMITS, DEFAULT_BURST, RateLimitScheduler
+
+
+def get_github_tokens(path: str | None = None) -> list[str]:
+    """Gets every GitHub token available, without duplicates.
+
+    The tokens are read from the GITHUB_TOKENS variable (separated by commas or spaces),
+    from the GITHUB_TOKEN and GITHUB_TOKEN_<n> variables, and from the file given as
+    path or in the GITHUB_TOKENS_FILE variable (one token per line).
+    """
+    tokens = os.environ.get("GITHUB_TOKENS", "").replace(",", " ").split()
+
+    names = sorted(name for name in os.environ if name == "GITHUB_TOKEN" or name.startswith("GITHUB_TOKEN_"))
+    tokens += [os.environ[name].strip() for name in names]
+
+    path = path or os.environ.get("GITHUB_TOKENS_FILE")
+    if path:
+        with open(path, encoding="utf-8") as file:
+            tokens += [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+    if not tokens:
+        print("Error: no GitHub token found. Please set GITHUB_TOKEN or GITHUB_TOKENS.")
+    return list(dict.fromkeys(token for token in tokens if token))
+
+
+def mask_token(token: str) -> str:
+    """Shortens a token so that it can be printed."""
+    return f"{token[:4]}...{token[-4:]}" if len(token) > 12 else "***"
+
+
+class TokenPool:
+    """Spreads the requests over several GitHub tokens.
+
+    Each token has its own RateLimitScheduler. A request is sent with the token having the
+    most remaining quota on the requested resource, and a token whose quota is used up is
+    parked until its reset time. The pool is used by GitHubSession for the GraphQL and REST
+    calls and by TokenPoolAuth for requests sessions.
+    """
+
+    def __init__(self, tokens: list[str], limits: dict[str, tuple[int, float]] = GITHUB_RATE_LIMITS, burst: int = DEFAULT_BURST):
+        if not tokens:
+            tokens = [""]
+        self.tokens = list(tokens)
+        self.schedulers = {token: RateLimitScheduler(limits, burst) for token in self.tokens}
+        self.requests_count = {token: 0 for token in self.tokens}
+        self.lock = threading.Lock()
+
+    def remaining(self, token: str, resource: str) -> int:
+        """Number of requests the token can still send on the resource before its reset."""
+        quota = self.schedulers[token].get_quota(resource)
+        if quota.reset is not None and quota.reset <= time.monotonic():
+            return quota.limit
+        return quota.limit if quota.remaining is None else quota.remaining
+
+    def parked_until(self, token: str, resource: str) -> float:
+        """Monotonic time until which the token cannot be used on the resource, 0 if it is available.
+
+        A token whose quota is used up stays parked until the reset time reported by GitHub.
+        """
+        quota = self.schedulers[token].get_quota(resource)
+        if quota.reset is not None and quota.remaining is not None and quota.remaining < 1:
+            return max(quota.reset, quota.blocked_until)
+        return quota.blocked_until
+
+    def choose(self, resource: str) -> str:
+        """Chooses the available token having the most remaining quota on the resource."""
+        with self.lock:
+            now = time.monotonic()
+            available = [token for token in self.tokens if self.parked_until(token, resource) <= now]
+            if available:
+                token = max(available, key=lambda token: self.remaining(token, resource))
+            else:
+                # Every token is parked: wait for the first one to be reset
+                token = min(self.tokens, key=lambda token: self.parked_until(token, resource))
+            self.requests_count[token] += 1
+            return token
+
+    def acquire(self, resource: str, cost: int = 1) -> str:
+        """Blocks until a request can be sent on the resource and returns the token to send it with."""
+        token = self.choose(resource)
+        self.schedulers[token].acquire(resource, cost)
+        return token
+
+    async def acquire_async(self, resource: str, cost: int = 1) -> str:
+        """Waits until a request can be sent on the resource and returns the token to send it with."""
+        token = self.choose(resource)
+        await self.schedulers[token].acquire_async(resource, cost)
+        return token
+
+    def block(self, token: str, resource: str, seconds: float) -> None:
+        """Parks a token on the resource for the given number of seconds, the other tokens being used meanwhile."""
+        self.schedulers[token].block(resource, seconds)
+
+    def update_from_headers(self, token: str, headers, resource: str | None = None) -> None:
+        self.schedulers[token].update_from_headers(headers, resource=resource)
+
+    def update_from_graphql(self, token: str, rate_limit: dict) -> None:
+        self.schedulers[token].update_from_graphql(rate_limit)
+
+    def stats(self) -> list[dict]:
+        """Usage of every token: requests sent, remaining quota and parking time per resource."""
+        now = time.monotonic()
+        stats = []
+        for token in self.tokens:
+            scheduler = self.schedulers[token]
+            stats.append({
+                "token": mask_token(token),
+                "requests": self.requests_count[token],
+                "remaining": {resource: self.remaining(token, resource) for resource in scheduler.quotas},
+                "parked_for": {
+                    resource: round(self.parked_until(token, resource) - now, 1)
+                    for resource in scheduler.quotas if self.parked_until(token, resource) > now
+                },
+            })
+        return stats
+
+
+class TokenPoolAuth(requests.auth.AuthBase):
+    """Authenticates the requests of a requests.Session with the tokens of a pool.
+
+        session.auth = TokenPoolAuth(pool)
+    """
+
+    def __init__(self, pool: TokenPool):
+        self.pool = pool
+
+    def __call__(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        resource = "search" if "/search/" in (request.url or "") else "core"
+        token = self.pool.acquire(resource)
+        if token:
+            request.headers["Authorization"] = f"Bearer {token}"
+
+        def update_quota(response: requests.Response, **kwargs) -> None:
+            self.pool.update_from_headers(token, response.headers, resource=resource)
+
+        request.register_hook("response", update_quota)
+        return request